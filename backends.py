@@ -0,0 +1,240 @@
+# backends.py – pluggable inference backends for CPU-only nodes.
+# The Ultralytics model is exported once to ONNX (ONNX Runtime) or OpenVINO, optionally with
+# INT8 post-training quantization calibrated on a local image folder, and the artifact is
+# cached under models/exported/. Exported models load back through YOLO(), so every caller
+# keeps the same predict() API and simply asks load() for the fastest backend available.
+#
+#   python backends.py --weights n --backend onnx --int8 --calib lot_photos/   # export once
+#   python backends.py --weights n --compare --images lot_photos/               # latency + agreement
+
+import os, glob, json, time, shutil, hashlib, argparse, threading, importlib.util
+import numpy as np
+
+from model_registry import get_model, default_device, resolve_weights, MODEL_SIZES
+from tiling import pairwise_iou
+from result_cache import weights_id
+
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "exported")
+BACKENDS = ("pytorch", "onnx", "openvino")
+CALIB_IMAGES = 64
+IMAGE_GLOBS = ("*.jpg", "*.jpeg", "*.png", "*.webp")
+
+_export_locks = {}  # artifact path → Lock, so concurrent callers export it once
+_lock = threading.Lock()
+
+
+def has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def cuda_available():
+    import torch
+    return torch.cuda.is_available()
+
+
+def available_backends():
+    found = ["pytorch"]
+    if has_module("onnxruntime"):
+        found.append("onnx")
+    if has_module("openvino"):
+        found.append("openvino")
+    return found
+
+
+def select_backend():
+    """Fastest backend for this box: PyTorch on CUDA, else OpenVINO, else ONNX Runtime, else PyTorch CPU."""
+    if cuda_available():
+        return "pytorch"
+    avail = available_backends()
+    for name in ("openvino", "onnx"):
+        if name in avail:
+            return name
+    return "pytorch"
+
+
+def calibration_images(folder, limit=CALIB_IMAGES):
+    paths = sorted(p for g in IMAGE_GLOBS for p in glob.glob(os.path.join(folder, "**", g), recursive=True))
+    if not paths:
+        raise FileNotFoundError(f"no calibration images in {folder}")
+    return paths[:limit]
+
+
+def artifact_path(weights, backend, int8=False, calib_dir=None):
+    """Export location, named after the exact .pt (path, size, mtime) and, for INT8, the calibration
+    folder, so another or a retrained best.pt is exported afresh instead of reusing a stale artifact."""
+    weights = resolve_weights(weights)
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    ident = weights_id(weights) + (f"|{os.path.abspath(calib_dir)}" if int8 and calib_dir else "")
+    stem += "_" + hashlib.sha256(ident.encode()).hexdigest()[:10]
+    suffix = "_int8" if int8 else ""
+    if backend == "onnx":
+        return os.path.join(EXPORT_DIR, f"{stem}{suffix}.onnx")
+    return os.path.join(EXPORT_DIR, f"{stem}{suffix}_openvino_model")
+
+
+def _letterbox(img, size):
+    import cv2
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nh, nw = int(round(h * r)), int(round(w * r))
+    canvas = np.full((size, size, 3), 114, np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    return canvas
+
+
+def _quantize_onnx(fp32_path, out_path, calib_dir, imgsz):
+    """Static INT8 (QDQ) quantization with ONNX Runtime, calibrated on local images."""
+    import cv2
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.paths = iter(calibration_images(calib_dir))
+
+        def get_next(self):
+            for p in self.paths:
+                img = cv2.imread(p)
+                if img is None:
+                    continue
+                x = _letterbox(img, imgsz)[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+                return {input_name: np.ascontiguousarray(x)}
+            return None
+
+    quantize_static(fp32_path, out_path, Reader(), quant_format=QuantFormat.QDQ,
+                    weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8, per_channel=True)
+    return out_path
+
+
+def _calib_yaml(calib_dir, names):
+    """Minimal dataset yaml so Ultralytics/NNCF can calibrate OpenVINO INT8 on a plain folder."""
+    path = os.path.join(EXPORT_DIR, "calib.yaml")
+    folder = os.path.abspath(calib_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"path: {folder}\ntrain: .\nval: .\nnames:\n")
+        for i, n in names.items():
+            f.write(f"  {i}: {n}\n")
+    return path
+
+
+def export(weights, backend, int8=False, calib_dir=None, imgsz=640):
+    """Export (once) and return the cached artifact path for an ONNX / OpenVINO backend."""
+    if backend not in ("onnx", "openvino"):
+        raise ValueError(f"nothing to export for backend {backend!r}")
+    if int8 and not calib_dir:
+        raise ValueError("INT8 quantization needs a calibration image folder")
+    target = artifact_path(weights, backend, int8, calib_dir)
+    # The fp32 ONNX file is an intermediate of the INT8 one, so both share the fp32 lock
+    with _lock:
+        artifact_lock = _export_locks.setdefault(artifact_path(weights, backend), threading.Lock())
+    with artifact_lock:
+        if os.path.exists(target):
+            return target
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        model = get_model(weights, "cpu")
+        if backend == "onnx":
+            fp32 = artifact_path(weights, "onnx")
+            if not os.path.exists(fp32):
+                shutil.move(model.export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True), fp32)
+            return _quantize_onnx(fp32, target, calib_dir, imgsz) if int8 else fp32
+        kwargs = {"int8": True, "data": _calib_yaml(calib_dir, model.names)} if int8 else {}
+        shutil.move(model.export(format="openvino", imgsz=imgsz, dynamic=True, **kwargs), target)
+        return target
+
+
+def load(weights="x", backend="auto", int8=False, calib_dir=None, imgsz=640, device=None):
+    """Return (model, device, backend_name) for the requested or fastest backend.
+
+    Any export/runtime problem falls back to PyTorch on the default device.
+    """
+    name = select_backend() if backend == "auto" else backend
+    if name == "pytorch":
+        device = default_device() if device is None else device
+        return get_model(weights, device), device, "pytorch"
+    try:
+        path = export(weights, name, int8, calib_dir, imgsz)
+        return get_model(path, "cpu"), "cpu", name + ("-int8" if int8 else "")
+    except Exception as e:
+        print(f"⚠️ {name} backend unavailable ({e}); falling back to PyTorch")
+        device = default_device() if device is None else device
+        return get_model(weights, device), device, "pytorch"
+
+
+# ----- comparison -----
+def _agreement(base, other, thr=0.5):
+    """Fraction of baseline boxes matched (same class, IoU ≥ thr) and their mean IoU."""
+    if not len(base):
+        return (1.0 if not len(other) else 0.0), 1.0
+    if not len(other):
+        return 0.0, 0.0
+    iou = pairwise_iou(base[:, :4], other[:, :4])
+    iou[base[:, 5][:, None] != other[:, 5][None, :]] = 0
+    best = iou.max(1)
+    matched = best >= thr
+    return float(matched.mean()), float(best[matched].mean()) if matched.any() else 0.0
+
+
+def compare(weights, images, backends=None, int8=False, calib_dir=None, imgsz=640, conf=0.25, runs=3):
+    """Latency and box agreement of each backend against the PyTorch baseline."""
+    import cv2
+    from detection import result_array
+    frames = [img for img in (cv2.imread(p) for p in images) if img is not None]
+    if not frames:
+        raise FileNotFoundError("no readable images to compare on")
+    backends = backends or available_backends()
+    report, baseline = {}, None
+    for name in ["pytorch"] + [b for b in backends if b != "pytorch"]:
+        model, device, label = load(weights, name, int8 and name != "pytorch", calib_dir, imgsz)
+        if name != "pytorch" and label == "pytorch":
+            continue  # fell back, nothing new to measure
+        model.predict(frames[0], imgsz=imgsz, device=device, verbose=False)  # warm-up
+        times, outputs = [], []
+        for _ in range(runs):
+            outputs = []
+            for img in frames:
+                t0 = time.perf_counter()
+                r = model.predict(img, imgsz=imgsz, conf=conf, device=device, verbose=False)[0]
+                times.append((time.perf_counter() - t0) * 1000)
+                outputs.append(result_array(r))
+        entry = {"p50_ms": round(float(np.percentile(times, 50)), 2),
+                 "p95_ms": round(float(np.percentile(times, 95)), 2),
+                 "mean_ms": round(float(np.mean(times)), 2)}
+        if baseline is None:
+            baseline = outputs
+        else:
+            scores = [_agreement(b, o) for b, o in zip(baseline, outputs)]
+            entry["recall_vs_pytorch"] = round(float(np.mean([s[0] for s in scores])), 4)
+            entry["mean_iou_vs_pytorch"] = round(float(np.mean([s[1] for s in scores])), 4)
+            entry["speedup"] = round(report["pytorch"]["mean_ms"] / entry["mean_ms"], 2)
+        report[label] = entry
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export / compare inference backends")
+    ap.add_argument("--weights", default="n", help=f"model size ({'/'.join(MODEL_SIZES)}) or weights path")
+    ap.add_argument("--backend", choices=("auto",) + BACKENDS, default="auto")
+    ap.add_argument("--int8", action="store_true", help="INT8 post-training quantization")
+    ap.add_argument("--calib", help="folder of local images for INT8 calibration")
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--compare", action="store_true", help="benchmark backends against PyTorch")
+    ap.add_argument("--images", help="folder of images for --compare (default: --calib)")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args(argv)
+    if args.compare:
+        folder = args.images or args.calib
+        if not folder:
+            ap.error("--compare needs --images")
+        backends = None if args.backend == "auto" else [args.backend]
+        print(json.dumps(compare(args.weights, calibration_images(folder, 32), backends, args.int8,
+                                 args.calib or folder, args.imgsz, runs=args.runs), indent=2))
+    else:
+        _, device, name = load(args.weights, args.backend, args.int8, args.calib, args.imgsz)
+        print(json.dumps({"backend": name, "device": str(device), "available": available_backends()}))
+
+
+if __name__ == "__main__":
+    main()
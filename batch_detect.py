@@ -0,0 +1,271 @@
+# batch_detect.py – headless vehicle detection over a directory or a manifest of image paths.
+# Images are decoded in a thread pool while the model works on fixed-size batches, and
+# results go to annotated images plus one JSONL line per image.
+#
+#   python batch_detect.py lot_photos/ --out detections/ --batch 16
+#   python batch_detect.py --manifest paths.txt --out detections/ --no-images
+#   python batch_detect.py lot_photos/ --procs 8 --backend onnx   # 8 CPU worker processes
+#   python batch_detect.py lot_photos/ --cascade --small n --large x --regions
+
+import os, json, time, hashlib, argparse
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+from model_registry import default_device, MODEL_SIZES
+import backends
+from detection import VEHICLE_LABELS, vehicle_boxes, vehicle_class_ids, draw_boxes
+from tiling import tiled_predict, TILE_OVERLAP
+from metrics import timed, record_yolo_speed, record_detection
+from result_cache import file_digest
+from detection_index import DetectionIndex, INDEX_DB
+from procpool import ProcessInferencePool, SLOTS_PER_WORKER
+from plates import PlateReader
+import cascade as cascade_mod
+
+IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".webp", ".bmp"}
+
+
+def collect_paths(source=None, manifest=None):
+    """Image paths from a directory walk (sorted) or a manifest file, one path per line."""
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, encoding="utf-8") as f:
+            for line in f:
+                p = line.strip()
+                if p and not p.startswith("#"):
+                    yield p if os.path.isabs(p) else os.path.join(base, p)
+        return
+    for root, dirs, files in os.walk(source):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTS:
+                yield os.path.join(root, name)
+
+
+def _decode(path):
+    with timed("decode"):
+        return path, cv2.imread(path)
+
+
+def iter_decoded(paths, pool, prefetch):
+    """Yield (path, ndarray|None) in input order, keeping at most `prefetch` decodes in flight."""
+    pending = deque()
+    for p in paths:
+        pending.append(pool.submit(_decode, p))
+        if len(pending) >= prefetch:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_batches(decoded, batch_size):
+    batch = []
+    for item in decoded:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def annotated_path(out_dir, path, root=None):
+    """detected_<name> in out_dir, in the same subfolder as below root so same-named images in
+    different folders don't overwrite each other; outside root, a short hash of the folder does that."""
+    folder, name = os.path.split(os.path.abspath(path))
+    try:
+        rel = os.path.relpath(folder, os.path.abspath(root)) if root else None
+    except ValueError:  # another drive (Windows)
+        rel = None
+    if rel is not None and rel != os.pardir and not rel.startswith(os.pardir + os.sep):
+        return os.path.normpath(os.path.join(out_dir, rel, f"detected_{name}"))
+    stem, ext = os.path.splitext(name)
+    return os.path.join(out_dir, f"detected_{stem}_{hashlib.sha1(folder.encode()).hexdigest()[:8]}{ext}")
+
+
+def _write_annotated(out_dir, path, img, boxes, root=None):
+    out = annotated_path(out_dir, path, root)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with timed("annotate"):
+        draw_boxes(img, boxes)
+    with timed("write"):
+        cv2.imwrite(out, img)
+    return out
+
+
+def _index_batch(index, rows, source, model_name):
+    """Hash each file and record the batch in the detection index (one transaction)."""
+    with timed("index"):
+        index.add_many([{"key": file_digest(p), "path": name or os.path.abspath(p), "boxes": boxes,
+                         "source": source, "model": model_name, "width": w, "height": h}
+                        for p, name, w, h, boxes in rows])
+
+
+def run(paths, model, out_dir, batch_size=8, workers=4, conf=0.20, iou=0.5, imgsz=1280,
+        device=None, save_images=True, jsonl_name="detections.jsonl", labels=VEHICLE_LABELS,
+        tile=0, overlap=TILE_OVERLAP, merge="nms", executor=None, plates=None, cascade=None,
+        index=None, source="batch", model_name=None, names=None, root=None):
+    """Detect vehicles in every path; returns a summary dict.
+
+    tile > 0 switches to sliced inference: each image runs as one batch of overlapping tiles.
+    executor (a ProcessInferencePool) replaces the in-process model, which may then be None.
+    plates (a PlateReader) adds b["plate"] to each box; a batch's crops are OCR'd together.
+    cascade (a CascadeDetector) replaces the model: cheap pass first, escalation where unsure.
+    index (a DetectionIndex) records every image under `source`, off the inference thread.
+    names maps a path to what the JSONL and the index record instead (e.g. its source URL).
+    root is the folder whose layout annotated images mirror under out_dir (see annotated_path).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    device = default_device() if device is None else device
+    class_ids = vehicle_class_ids(model.names, labels) if model is not None else None
+    images = vehicles = failed = 0
+    t0 = time.perf_counter()
+    jsonl_path = os.path.join(out_dir, jsonl_name)
+    with ThreadPoolExecutor(workers) as decode_pool, ThreadPoolExecutor(workers) as write_pool, \
+            open(jsonl_path, "w", encoding="utf-8") as out:
+        writes = deque()
+        decoded = iter_decoded(paths, decode_pool, prefetch=batch_size * 2)
+        for batch in iter_batches(decoded, batch_size):
+            ok = [(p, img) for p, img in batch if img is not None]
+            for p, img in batch:
+                if img is None:
+                    failed += 1
+                    out.write(json.dumps({"path": names.get(p, p) if names else p, "error": "unreadable image"}) + "\n")
+            if not ok:
+                continue
+            if cascade is not None:
+                per_image = cascade.detect([img for _, img in ok])
+            elif executor is not None:
+                per_image = list(executor.map(img for _, img in ok))
+            elif tile:
+                per_image = [tiled_predict(model, img, tile=tile, overlap=overlap, labels=labels,
+                                           conf=conf, iou=iou, merge=merge, device=device)
+                             for _, img in ok]
+            else:
+                results = model.predict([img for _, img in ok], conf=conf, iou=iou, imgsz=imgsz,
+                                        classes=class_ids, device=device, verbose=False)
+                record_yolo_speed(results)
+                per_image = [vehicle_boxes(r, labels) for r in results]
+            if plates is not None:
+                plates.read_many([(img, boxes) for (_, img), boxes in zip(ok, per_image)])
+            if index is not None:
+                rows = [(p, names.get(p) if names else None, img.shape[1], img.shape[0], boxes)
+                        for (p, img), boxes in zip(ok, per_image)]
+                writes.append(write_pool.submit(_index_batch, index, rows, source, model_name))
+            for (p, img), boxes in zip(ok, per_image):
+                images += 1
+                vehicles += len(boxes)
+                record_detection(len(boxes))
+                h, w = img.shape[:2]
+                out.write(json.dumps({"path": names.get(p, p) if names else p, "width": w, "height": h,
+                                      "count": len(boxes), "boxes": boxes}) + "\n")
+                if save_images:
+                    writes.append(write_pool.submit(_write_annotated, out_dir, p, img, boxes, root))
+            # Keep the write queue bounded so annotated frames don't pile up in memory
+            while len(writes) > batch_size * 2:
+                writes.popleft().result()
+        for w in writes:
+            w.result()
+    elapsed = time.perf_counter() - t0
+    summary = {
+        "images": images,
+        "failed": failed,
+        "vehicles": vehicles,
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(images / elapsed, 2) if elapsed else 0.0,
+        "jsonl": jsonl_path,
+    }
+    if plates is not None:
+        summary["plate_ocr"] = plates.stats()
+    if cascade is not None:
+        summary["cascade"] = cascade.stats.as_dict()
+    if index is not None:
+        summary["index"] = index.path
+    return summary
+
+
+def add_detector_arguments(ap):
+    """Model / inference options shared by this CLI and ingest.py."""
+    ap.add_argument("--weights", default="x", help=f"model size ({'/'.join(MODEL_SIZES)}) or weights path")
+    ap.add_argument("--batch", type=int, default=8, help="images per model call")
+    ap.add_argument("--workers", type=int, default=4, help="decode / write threads")
+    ap.add_argument("--conf", type=float, default=0.20)
+    ap.add_argument("--iou", type=float, default=0.5)
+    ap.add_argument("--imgsz", type=int, default=1280)
+    ap.add_argument("--device", default=None, help="e.g. cpu, 0 (default: CUDA if available)")
+    ap.add_argument("--no-images", action="store_true", help="only write the JSONL")
+    ap.add_argument("--backend", choices=("auto",) + backends.BACKENDS, default="auto",
+                    help="inference backend (auto: CUDA PyTorch, else OpenVINO / ONNX Runtime)")
+    ap.add_argument("--int8", action="store_true", help="INT8-quantized ONNX/OpenVINO export")
+    ap.add_argument("--calib", help="folder of images for INT8 calibration (default: source)")
+    ap.add_argument("--classes", default=",".join(sorted(VEHICLE_LABELS)),
+                    help="comma-separated class names to keep")
+    ap.add_argument("--tile", type=int, default=0, help="tile size for sliced inference (0 = off)")
+    ap.add_argument("--overlap", type=float, default=TILE_OVERLAP, help="tile overlap fraction")
+    ap.add_argument("--merge", choices=["nms", "wbf"], default="nms", help="cross-tile box merging")
+    ap.add_argument("--plates", action="store_true", help="read license plates on vehicle crops (easyocr)")
+    ap.add_argument("--cascade", action="store_true",
+                    help="small model first, escalate ambiguous images/regions to --large (ignores --weights)")
+    cascade_mod.add_arguments(ap)
+    ap.add_argument("--procs", type=int, default=0,
+                    help="CPU inference worker processes with shared-memory frames (0 = in-process)")
+    ap.add_argument("--threads", type=int, default=None, help="torch threads per worker process")
+    ap.add_argument("--index", nargs="?", const=INDEX_DB, default=None, metavar="DB",
+                    help=f"record detections in the SQLite detection index (default DB: {INDEX_DB})")
+    return ap
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(description="Batch vehicle detection (headless)")
+    ap.add_argument("source", nargs="?", help="directory of images (walked recursively)")
+    ap.add_argument("--manifest", help="text file with one image path per line")
+    ap.add_argument("--out", default="detections", help="output directory")
+    return add_detector_arguments(ap)
+
+
+@contextmanager
+def detector_from_args(args, calib_dir=None):
+    """(model, run() kwargs, extra summary fields) for the parsed detector options.
+
+    Covers the three modes: --cascade, --procs worker processes, and one in-process model.
+    """
+    labels = {c.strip().lower() for c in args.classes.split(",") if c.strip()}
+    common = dict(batch_size=args.batch, workers=args.workers, save_images=not args.no_images, labels=labels,
+                  plates=PlateReader() if args.plates else None,
+                  index=DetectionIndex(args.index) if args.index else None)
+    if args.cascade:
+        cascade = cascade_mod.from_args(args, args.conf, args.iou, labels, args.backend, args.device)
+        yield None, dict(common, device=args.device, cascade=cascade,
+                         model_name=f"cascade:{args.small}->{args.large}"), {}
+    elif args.procs:
+        backend = "pytorch" if args.backend == "auto" else args.backend
+        with ProcessInferencePool(args.weights, workers=args.procs, threads=args.threads, backend=backend,
+                                  int8=args.int8, calib_dir=args.calib or calib_dir, labels=labels,
+                                  conf=args.conf, iou=args.iou, imgsz=args.imgsz, batch=args.batch) as pool:
+            pool.wait_ready()
+            # Batches wide enough that every worker has frames queued behind the current one
+            yield None, dict(common, batch_size=max(args.batch, args.procs * SLOTS_PER_WORKER), device="cpu",
+                             executor=pool, model_name=args.weights), {"backend": backend, "procs": args.procs}
+    else:
+        model, device, backend = backends.load(args.weights, args.backend, args.int8,
+                                               args.calib or calib_dir, device=args.device)
+        yield model, dict(common, conf=args.conf, iou=args.iou, imgsz=args.imgsz, device=device, tile=args.tile,
+                          overlap=args.overlap, merge=args.merge, model_name=args.weights), {"backend": backend}
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not args.source and not args.manifest:
+        build_parser().error("give a source directory or --manifest")
+    if (args.procs or args.cascade) and args.tile:
+        build_parser().error("--procs / --cascade do not support --tile")
+    paths = collect_paths(args.source, args.manifest)
+    with detector_from_args(args, calib_dir=args.source) as (model, run_kwargs, extra):
+        summary = run(paths, model, args.out, root=None if args.manifest else args.source, **run_kwargs)
+    print(json.dumps({**summary, **extra}))
+
+
+if __name__ == "__main__":
+    main()
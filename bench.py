@@ -0,0 +1,277 @@
+# bench.py – reproducible benchmarks for the detection, upload and thumbnail hot paths.
+# Test images are synthesized locally (seeded, no network). Each benchmark reports
+# p50/p95/p99 latency and throughput; results go to JSON and can be compared against a
+# saved baseline, exiting non-zero on regressions so rollouts can be gated on numbers.
+#
+#   python bench.py --out bench_baseline.json
+#   python bench.py --compare bench_baseline.json --tolerance 0.15
+#   python bench.py --only boxes,upload,thumbs       # no model needed
+#   python bench.py --only predict --tiled --photos lot_photos/   # tiles vs one 1920 pass
+
+import os, io, sys, json, time, shutil, platform, argparse, tempfile
+import numpy as np
+import cv2
+
+BENCHES = ("predict", "boxes", "upload", "thumbs")
+COCO_VEHICLES = {2: "car", 3: "motorcycle", 5: "bus", 7: "truck"}
+
+
+# ----- synthetic data -----
+def synthetic_lot(width, height, cars=12, seed=0):
+    """Parking-lot-like BGR image: asphalt, lane lines and boxy 'cars' with windows and wheels."""
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 90, np.uint8)
+    img += rng.integers(0, 20, (height, width, 1), dtype=np.uint8)  # asphalt noise
+    for x in range(0, width, max(40, width // 12)):
+        cv2.line(img, (x, 0), (x, height), (230, 230, 230), 2)
+    for _ in range(cars):
+        w = int(rng.integers(width // 14, width // 6))
+        h = int(w * rng.uniform(0.45, 0.6))
+        x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+        color = tuple(int(c) for c in rng.integers(30, 255, 3))
+        cv2.rectangle(img, (x, y + h // 4), (x + w, y + h), color, -1)                     # body
+        cv2.rectangle(img, (x + w // 5, y), (x + 4 * w // 5, y + h // 3), color, -1)       # cabin
+        cv2.rectangle(img, (x + w // 4, y + h // 20), (x + 3 * w // 4, y + h // 4), (60, 40, 30), -1)  # windows
+        for cx in (x + w // 5, x + 4 * w // 5):
+            cv2.circle(img, (cx, y + h), max(3, h // 6), (20, 20, 20), -1)                # wheels
+    return img
+
+
+def write_images(folder, n, size=(1920, 1080), seed=0):
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(n):
+        p = os.path.join(folder, f"lot_{i:03d}.jpg")
+        cv2.imwrite(p, synthetic_lot(*size, seed=seed + i), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        paths.append(p)
+    return paths
+
+
+def fake_result(n_boxes, names, seed=0, width=1920, height=1080):
+    """Ultralytics Results with n random boxes, so box post-processing can run without a model."""
+    import torch
+    from ultralytics.engine.results import Results
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, [width - 60, height - 40], (n_boxes, 2))
+    wh = rng.uniform([20, 15], [200, 120], (n_boxes, 2))
+    data = np.column_stack([xy, xy + wh, rng.uniform(0.2, 1, n_boxes),
+                            rng.choice(list(names), n_boxes)]).astype(np.float32)
+    return Results(np.zeros((height, width, 3), np.uint8), "bench", names, boxes=torch.from_numpy(data))
+
+
+# ----- measurement -----
+def summarize(samples_s, items_per_sample=1):
+    ms = np.asarray(samples_s) * 1000
+    total = float(np.sum(samples_s))
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "throughput_per_s": round(len(ms) * items_per_sample / total, 2) if total else 0.0,
+    }
+
+
+def timeit(fn, runs, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+# ----- benchmarks -----
+def bench_predict(paths, weights, imgsizes, runs):
+    import backends
+    model, device, backend = backends.load(weights, "pytorch")
+    frames = [cv2.imread(p) for p in paths]
+    out = {}
+    for size in imgsizes:
+        i = iter(range(10 ** 9))
+        fn = lambda: model.predict(frames[next(i) % len(frames)], imgsz=size, device=device, verbose=False)
+        out[f"predict_imgsz{size}"] = summarize(timeit(fn, runs))
+    return out
+
+
+def bench_tiled(paths, weights, runs):
+    """Tiled inference vs one 1920 pass on the same frames: latency plus vehicles found per image."""
+    import backends
+    from detection import vehicle_boxes
+    from tiling import tiled_predict, TILE_SIZE
+    model, device, _ = backends.load(weights, "pytorch")
+    frames = [cv2.imread(p) for p in paths]
+    passes = {
+        "full_1920": lambda f: vehicle_boxes(model.predict(f, imgsz=1920, conf=0.20, device=device,
+                                                           verbose=False)[0]),
+        f"tiled_{TILE_SIZE}": lambda f: tiled_predict(model, f, conf=0.20, device=device),
+    }
+    out = {}
+    for name, detect in passes.items():
+        counts = [len(detect(f)) for f in frames]  # doubles as the warm-up
+        i = iter(range(10 ** 9))
+        stats = summarize(timeit(lambda: detect(frames[next(i) % len(frames)]), runs, warmup=0))
+        out[f"detect_{name}"] = {**stats, "vehicles_per_image": round(float(np.mean(counts)), 2)}
+    return out
+
+
+def legacy_box_loop(results, img):
+    """The original per-box loop from CarDetector._detect_worker, kept as a reference point."""
+    count = 0
+    for r in results:
+        for b in r.boxes:
+            cls = int(b.cls[0])
+            label = r.names[cls]
+            if label.lower() in ["car", "truck", "bus", "motorbike"]:
+                count += 1
+                x1, y1, x2, y2 = map(int, b.xyxy[0])
+                cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    return count
+
+
+def bench_boxes(runs, sizes=(50, 300)):
+    from detection import vehicle_boxes, draw_boxes
+    names = {i: COCO_VEHICLES.get(i, f"class{i}") for i in range(80)}
+    canvas = np.zeros((1080, 1920, 3), np.uint8)
+    out = {}
+    for n in sizes:
+        r = fake_result(n, names, seed=n)
+        out[f"boxes_legacy_{n}"] = summarize(timeit(lambda: legacy_box_loop([r], canvas), runs))
+        out[f"boxes_vectorized_{n}"] = summarize(timeit(lambda: draw_boxes(canvas, vehicle_boxes(r)), runs))
+    return out
+
+
+def bench_upload(paths, runs):
+    """POST /upload through the Flask test client into a throwaway upload directory."""
+    import carparts_gui_server as server
+    from upload_store import streaming_request_class
+    tmp = tempfile.mkdtemp(prefix="bench_uploads_")
+    saved = server.UPLOAD_DIR, server.app.request_class
+    server.UPLOAD_DIR = tmp
+    server.app.request_class = streaming_request_class(tmp, server.ALLOWED)
+    try:
+        client = server.app.test_client()
+        blobs = [(os.path.basename(p), open(p, "rb").read()) for p in paths]
+        i = iter(range(10 ** 9))
+
+        def post():
+            name, data = blobs[next(i) % len(blobs)]
+            r = client.post("/upload", data={"file": (io.BytesIO(data), name)})
+            assert r.status_code == 200, r.data
+
+        first = summarize(timeit(post, len(blobs), warmup=0))  # new content
+        dup = summarize(timeit(post, runs, warmup=0))          # mostly duplicates
+        mb = sum(len(d) for _, d in blobs) / 1e6
+        first["mb_per_s"] = round(mb / (first["mean_ms"] * len(blobs) / 1000), 2)
+        return {"upload_new": first, "upload_duplicate": dup}
+    finally:
+        server.UPLOAD_DIR, server.app.request_class = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def bench_thumbs(paths, runs, size=(220, 220)):
+    """Gallery thumbnailing: the old full decode vs draft-mode decode vs the on-disk cache."""
+    from PIL import Image
+    from thumbnails import ThumbnailCache, make_thumbnail
+    i = iter(range(10 ** 9))
+
+    def full():
+        im = Image.open(paths[next(i) % len(paths)])
+        im.thumbnail(size)
+
+    tmp = tempfile.mkdtemp(prefix="bench_thumbs_")
+    try:
+        cache = ThumbnailCache(tmp, size, workers=1, max_memory=0)
+        for p in paths:
+            cache.get(p)  # populate the disk cache
+        out = {"thumb_full_decode": summarize(timeit(full, runs)),
+               "thumb_draft_decode": summarize(timeit(lambda: make_thumbnail(paths[next(i) % len(paths)], size), runs)),
+               "thumb_disk_cached": summarize(timeit(lambda: cache.get(paths[next(i) % len(paths)]), runs))}
+        cache.close()
+        return out
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# ----- baseline comparison -----
+def compare(current, baseline, tolerance):
+    """Regressions where latency grew or throughput fell by more than tolerance (fraction)."""
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            if base[metric] and cur[metric] > base[metric] * (1 + tolerance):
+                regressions.append({"bench": name, "metric": metric, "baseline": base[metric], "current": cur[metric],
+                                    "change": round(cur[metric] / base[metric] - 1, 3)})
+        if base["throughput_per_s"] and cur["throughput_per_s"] < base["throughput_per_s"] * (1 - tolerance):
+            regressions.append({"bench": name, "metric": "throughput_per_s", "baseline": base["throughput_per_s"],
+                                "current": cur["throughput_per_s"],
+                                "change": round(cur["throughput_per_s"] / base["throughput_per_s"] - 1, 3)})
+    return regressions
+
+
+def run(only, weights, imgsizes, runs, n_images, size, seed, tiled=False, photos=None):
+    folder = tempfile.mkdtemp(prefix="bench_images_")
+    try:
+        paths = write_images(folder, n_images, size, seed)
+        results = {}
+        if "predict" in only:
+            results.update(bench_predict(paths, weights, imgsizes, runs))
+        if tiled:
+            # Real photos with small / distant cars show the recall side; synthetic ones only the cost
+            import backends
+            results.update(bench_tiled(backends.calibration_images(photos, n_images) if photos else paths,
+                                       weights, runs))
+        if "boxes" in only:
+            results.update(bench_boxes(runs * 10))
+        if "upload" in only:
+            results.update(bench_upload(paths, runs * 4))
+        if "thumbs" in only:
+            results.update(bench_thumbs(paths, runs * 4))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    meta = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+            "weights": weights, "images": n_images, "photos": photos, "image_size": list(size), "seed": seed, "runs": runs,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return {"meta": meta, "results": results}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark detection / upload / thumbnail hot paths")
+    ap.add_argument("--only", default=",".join(BENCHES), help=f"comma-separated subset of {','.join(BENCHES)}")
+    ap.add_argument("--weights", default="n")
+    ap.add_argument("--imgsz", default="640,1280,1920", help="imgsz values for the predict benchmark")
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--images", type=int, default=8, help="synthetic images to generate")
+    ap.add_argument("--size", default="1920x1080", help="synthetic image size WxH")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--tiled", action="store_true", help="also compare tiled inference with one 1920 pass")
+    ap.add_argument("--photos", help="folder of real images for --tiled (default: the synthetic ones)")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--compare", help="baseline JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown fraction")
+    args = ap.parse_args(argv)
+
+    only = {b.strip() for b in args.only.split(",") if b.strip()}
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    report = run(only, args.weights, [int(s) for s in args.imgsz.split(",")], args.runs, args.images, size, args.seed,
+                 args.tiled, args.photos)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        print(json.dumps({"regressions": regressions}, indent=2))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,77 @@
 # carparts_gui_server.py
 # Flask + Tkinter GUI that uploads local files or downloads images directly from a URL.
 
-import os, threading, uuid, requests
-from flask import Flask, request, jsonify, send_from_directory
-from werkzeug.utils import secure_filename
-from tkinter import Tk, Frame, Button, Label, Entry, filedialog, StringVar, Canvas, Scrollbar, NW, BOTH, RIGHT, Y, LEFT, X, TOP, BOTTOM
-from PIL import Image, ImageTk
+import os, json, time, threading, requests
+from concurrent.futures import TimeoutError as FutureTimeout
+import cv2
+import numpy as np
+from flask import Flask, request, jsonify, send_file, g, Response, stream_with_context
+from werkzeug.utils import safe_join
+from PIL import Image
+from tkinter import Tk, Frame, Button, Label, Entry, filedialog, StringVar, BOTH, RIGHT, LEFT, X, TOP, BOTTOM
+
+from scheduler import BatchScheduler
+from model_registry import resolve_weights, loaded_models
+import backends
+from metrics import REGISTRY, REQUEST_SECONDS, BYTES_WRITTEN, timed, overlay_text
+from result_cache import DetectionCache, cache_key, bytes_digest
+from upload_client import UploadEngine, summarize
+from tk_dispatch import TkDispatcher
+from gallery import VirtualGallery
+from jobs import JobQueue, QueueFull, FINAL_STATES
+from detection_index import DetectionIndex, MAX_PAGE
+from variants import VariantStore, parse_params, FORMATS, VARIANT_PARAMS
+from upload_store import MAX_UPLOAD_BYTES, streaming_request_class, store_upload, store_chunks, find_by_digest
 
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 ALLOWED = {"png", "jpg", "jpeg", "webp"}
 PORT = 5000
+UPLOAD_WORKERS = 4
+
+# /uploads serves originals plus ?w=&fmt=&q= variants with ETag, Cache-Control and Range support
+THUMB_WIDTH = 200  # width advertised in /upload's thumb_url
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600  # sha256-named files and their variants never change
+MUTABLE_MAX_AGE = 3600
+
+# Detection: one scheduler owns the model and coalesces concurrent /detect calls into batches
+DETECT_WEIGHTS = "x"  # model size letter or weights path, see model_registry.MODEL_SIZES
+DETECT_BACKEND = "auto"  # auto | pytorch | onnx | openvino (auto: CUDA, else fastest CPU runtime)
+DETECT_INT8 = False      # INT8-quantized ONNX/OpenVINO export, calibrated on DETECT_CALIB_DIR
+DETECT_CALIB_DIR = None
+DETECT_WARMUP = False  # load + warm the model when the server starts instead of on first /detect
+DETECT_IMGSZ = 1280
+DETECT_MAX_BATCH = 8
+DETECT_MAX_WAIT_MS = 15
+DETECT_TIMEOUT_S = 60
+JOB_WORKERS = DETECT_MAX_BATCH  # enough concurrent jobs to fill one scheduler batch
+JOB_SSE_HEARTBEAT_S = 15
 
 # ------------------ Flask backend ------------------
 app = Flask(__name__)
 app.config["UPLOAD_FOLDER"] = UPLOAD_DIR
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+# Multipart files stream into hashed temp files inside uploads/ instead of being buffered
+app.request_class = streaming_request_class(UPLOAD_DIR, ALLOWED, MAX_UPLOAD_BYTES)
+
+@app.before_request
+def _start_timer():
+    g.t0 = time.perf_counter()
+
+@app.after_request
+def _record_latency(resp):
+    if request.endpoint != "prometheus_metrics":
+        REQUEST_SECONDS.observe(time.perf_counter() - g.get("t0", time.perf_counter()),
+                                endpoint=request.endpoint or "unknown", status=resp.status_code)
+    return resp
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({"error": f"file too large (max {MAX_UPLOAD_BYTES // (1024 * 1024)} MB)"}), 413
+
+@app.errorhandler(415)
+def unsupported(e):
+    return jsonify({"error": "unsupported type"}), 415
 
 @app.route("/upload", methods=["POST"])
 def upload():
@@ -26,17 +83,313 @@ def upload():
     ext = f.filename.rsplit(".", 1)[-1].lower()
     if ext not in ALLOWED:
         return jsonify({"error": "unsupported type"}), 415
-    filename = secure_filename(f"{uuid.uuid4().hex}.{ext}")
-    path = os.path.join(UPLOAD_DIR, filename)
-    f.save(path)
-    return jsonify({"url": f"/uploads/{filename}", "filename": filename})
+    try:
+        with timed("store_upload"):
+            filename, digest, created = store_upload(f, UPLOAD_DIR, MAX_UPLOAD_BYTES)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 415
+    if created:
+        BYTES_WRITTEN.observe(os.path.getsize(os.path.join(UPLOAD_DIR, *filename.split("/"))), kind="upload")
+    # Content-addressed: the same bytes always come back with the same URL
+    return jsonify({"url": f"/uploads/{filename}", "filename": filename,
+                    "thumb_url": f"/uploads/{filename}?w={THUMB_WIDTH}",
+                    "sha256": digest, "duplicate": not created})
+
+@app.route("/upload/<digest>", methods=["GET"])
+def upload_exists(digest):
+    # Lets clients skip files the server already has (resumable bulk uploads)
+    if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+        return jsonify({"error": "bad digest"}), 400
+    filename = find_by_digest(UPLOAD_DIR, digest)
+    if not filename:
+        return jsonify({"error": "not found"}), 404
+    return jsonify({"url": f"/uploads/{filename}", "filename": filename, "sha256": digest})
+
+_detect_backend = []  # backend name load() actually picked (differs from the plan on a PyTorch fallback)
+
+def _load_detect_model():
+    # lazy + cached, so the uploader GUI starts fast
+    model, _, name = backends.load(DETECT_WEIGHTS, DETECT_BACKEND, DETECT_INT8, DETECT_CALIB_DIR)
+    _detect_backend[:] = [name]
+    return model
+
+def _detect_backend_name():
+    """Backend for cache keys, so onnx / openvino / pytorch results never share one. Before the
+    scheduler has loaded the model this is the planned backend: keys never load it themselves."""
+    if _detect_backend:
+        return _detect_backend[0]
+    name = backends.select_backend() if DETECT_BACKEND == "auto" else DETECT_BACKEND
+    return name + ("-int8" if DETECT_INT8 and name != "pytorch" else "")
+
+def _result_key(digest, weights):
+    return cache_key(digest, weights, conf=scheduler.predict_kwargs["conf"], iou=scheduler.predict_kwargs["iou"],
+                     imgsz=DETECT_IMGSZ, labels=scheduler.labels, backend=_detect_backend_name(), int8=DETECT_INT8)
+
+def _lazy(factory):
+    """Getter that builds the object on first call, so importing this module opens no SQLite file."""
+    lock, box = threading.Lock(), []
+    def get():
+        with lock:
+            if not box:
+                box.append(factory())
+        return box[0]
+    return get
+
+scheduler = BatchScheduler(_load_detect_model, max_batch=DETECT_MAX_BATCH,
+                           max_wait_ms=DETECT_MAX_WAIT_MS, imgsz=DETECT_IMGSZ)
+detect_cache = DetectionCache()
+detection_index = _lazy(DetectionIndex)
+variants = VariantStore()
+
+def _detect_bytes(data, name=None, source="api"):
+    """(result dict, cached) for encoded image bytes, via the cache and the batch scheduler.
+    Every result also lands in the detection index, keyed by the image's sha256."""
+    digest = bytes_digest(data)
+    weights = resolve_weights(DETECT_WEIGHTS)
+    hit = detect_cache.get(_result_key(digest, weights))
+    if hit is not None:
+        if not detection_index().has(digest):  # cached before the index existed
+            _index_result(digest, hit, name, source, weights)
+        return hit, True
+    with timed("decode"):
+        img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("could not decode image")
+    boxes = scheduler.detect(img, timeout=DETECT_TIMEOUT_S)
+    h, w = img.shape[:2]
+    result = {"count": len(boxes), "boxes": boxes, "width": w, "height": h}
+    detect_cache.put(_result_key(digest, weights), result)  # the backend that actually ran
+    _index_result(digest, result, name, source, weights)
+    return result, False
+
+def _index_result(digest, result, name, source, weights):
+    with timed("index"):
+        detection_index().add(digest, result["boxes"], path=name, source=source, model=os.path.basename(str(weights)),
+                            width=result["width"], height=result["height"])
+
+def _upload_path(name):
+    path = safe_join(UPLOAD_DIR, name) if name else None
+    return path if path and os.path.isfile(path) else None
+
+@app.route("/detect", methods=["POST"])
+def detect():
+    # Accept either a multipart "file" or the filename of an earlier upload
+    name = None
+    if "file" in request.files:
+        data = request.files["file"].read()
+    else:
+        name = (request.get_json(silent=True) or {}).get("filename") or request.form.get("filename")
+        if not name:
+            return jsonify({"error": "no file or filename"}), 400
+        path = _upload_path(name)
+        if path is None:
+            return jsonify({"error": "unknown filename"}), 404
+        with open(path, "rb") as f:
+            data = f.read()
+    try:
+        result, cached = _detect_bytes(data, name, source="detect")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 415
+    except FutureTimeout:
+        return jsonify({"error": "detection timed out"}), 503
+    return jsonify({**result, "cached": cached})
+
+@app.route("/detect/cache")
+def detect_cache_stats():
+    return jsonify(detect_cache.stats())
+
+# ------------------ Detection index ------------------
+# Queries over every image ever detected, answered from SQLite indexes (never a scan of uploads/)
+def _float_arg(name):
+    value = request.args.get(name)
+    return None if value in (None, "") else float(value)
+
+def _with_url(item):
+    # server-side detections store the upload's filename; CLI / GUI ones a local path
+    served = item["source"] in ("detect", "job") and item["path"]
+    return {**item, "url": f"/uploads/{item['path']}" if served else None}
+
+@app.route("/index/images")
+def index_images():
+    # ?label=truck&min_count=5&min_conf=0.6&plate=&source=&since=&until=&limit=&cursor=
+    args = request.args
+    try:
+        items, nxt = detection_index().query(
+            label=args.get("label") or None, min_count=args.get("min_count", type=int),
+            max_count=args.get("max_count", type=int), min_conf=_float_arg("min_conf"),
+            plate=args.get("plate") or None, source=args.get("source") or None,
+            since=_float_arg("since"), until=_float_arg("until"),
+            limit=min(args.get("limit", 50, type=int), MAX_PAGE), cursor=args.get("cursor") or None)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"items": [_with_url(it) for it in items], "next": nxt})
+
+@app.route("/index/images/<key>")
+def index_image(key):
+    item = detection_index().get(key)
+    if item is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(_with_url(item))
+
+@app.route("/index/recent")
+def index_recent():
+    items = detection_index().recent(min(request.args.get("limit", 20, type=int), MAX_PAGE))
+    return jsonify({"items": [_with_url(it) for it in items]})
+
+@app.route("/index/stats")
+def index_stats():
+    try:
+        groups = detection_index().aggregate(request.args.get("by", "label"), source=request.args.get("source") or None,
+                                           since=_float_arg("since"), until=_float_arg("until"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({**detection_index().totals(), "groups": groups})
+
+# ------------------ Detection jobs ------------------
+def _run_detect_job(ctx):
+    path = _upload_path(ctx.payload.get("filename"))
+    if path is None:
+        raise LookupError(f"unknown filename: {ctx.payload.get('filename')}")
+    with open(path, "rb") as f:
+        data = f.read()
+    ctx.progress(0.1)
+    result, cached = _detect_bytes(data, ctx.payload["filename"], source="job")
+    return {**result, "cached": cached, "filename": ctx.payload["filename"]}
+
+job_queue = _lazy(lambda: JobQueue(_run_detect_job, workers=JOB_WORKERS))
+
+def _job_links(job_id):
+    return {"id": job_id, "url": f"/jobs/{job_id}", "events": f"/jobs/{job_id}/events"}
+
+@app.route("/jobs", methods=["POST"])
+def submit_jobs():
+    # multipart "file" (stored like /upload first), or JSON {"filename"} / {"filenames": [...]}
+    body = request.get_json(silent=True) or {}
+    priority = body.get("priority", request.form.get("priority", 0))
+    try:
+        priority = int(priority)
+    except (TypeError, ValueError):
+        return jsonify({"error": "priority must be an integer"}), 400
+    if "file" in request.files:
+        try:
+            name, _, _ = store_upload(request.files["file"], UPLOAD_DIR, MAX_UPLOAD_BYTES)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 415
+        names = [name]
+    else:
+        names = body.get("filenames") or ([body["filename"]] if body.get("filename") else [])
+        if not names:
+            return jsonify({"error": "no file, filename or filenames"}), 400
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            return jsonify({"error": "filename must be a string and filenames a list of strings"}), 400
+        missing = [n for n in names if _upload_path(n) is None]
+        if missing:
+            return jsonify({"error": "unknown filename", "filenames": missing}), 404
+    job_queue().start()
+    try:
+        jobs = [{**_job_links(job_queue().submit({"filename": n}, priority)), "filename": n} for n in names]
+    except QueueFull as e:
+        return jsonify({"error": f"job queue full ({e})"}), 429
+    return jsonify(jobs[0] if len(jobs) == 1 and "filenames" not in body else {"jobs": jobs}), 202
+
+@app.route("/jobs")
+def list_jobs():
+    state = request.args.get("state")
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    offset = request.args.get("offset", 0, type=int)
+    return jsonify({"jobs": job_queue().list(state, limit, offset), "counts": job_queue().counts()})
+
+@app.route("/jobs/<job_id>")
+def get_job(job_id):
+    job = job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    if job_queue().get(job_id) is None:
+        return jsonify({"error": "not found"}), 404
+    if not job_queue().cancel(job_id):
+        return jsonify({"error": "job already finished"}), 409
+    return jsonify(job_queue().get(job_id))
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    # Server-Sent Events: one "data:" line per state/progress change until the job finishes
+    job = job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "not found"}), 404
+
+    def stream():
+        last = None
+        version = job_queue().version
+        while True:
+            job = job_queue().get(job_id)
+            snapshot = (job["state"], job["progress"])
+            if snapshot != last:
+                last = snapshot
+                yield f"event: {job['state']}\ndata: {json.dumps(job)}\n\n"
+                if job["state"] in FINAL_STATES:
+                    return
+            new_version = job_queue().wait_change(version, JOB_SSE_HEARTBEAT_S)
+            if new_version == version:
+                yield ": keep-alive\n\n"
+            version = new_version
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+REGISTRY.gauge("carrec_jobs", "Detection jobs by state", lambda: {(("state", k),): v for k, v in job_queue().counts().items()})
+REGISTRY.gauge("carrec_cache_hits", "Detection cache hits", lambda: detect_cache.stats()["hits"])
+REGISTRY.gauge("carrec_cache_misses", "Detection cache misses", lambda: detect_cache.stats()["misses"])
+REGISTRY.gauge("carrec_cache_disk_bytes", "Detection cache size on disk",
+               lambda: detect_cache.stats()["disk_bytes"] or 0)
+REGISTRY.gauge("carrec_scheduler_batches", "Predict calls made by the /detect scheduler", lambda: scheduler.batches)
+REGISTRY.gauge("carrec_scheduler_queue", "Frames waiting for the /detect scheduler", lambda: scheduler._queue.qsize())
+REGISTRY.gauge("carrec_variant_renders", "Resized upload variants rendered", lambda: variants.renders)
+REGISTRY.gauge("carrec_variant_hits", "Resized upload variants served from disk", lambda: variants.hits)
+REGISTRY.gauge("carrec_index_images", "Images in the detection index", lambda: detection_index().totals()["images"])
+REGISTRY.gauge("carrec_models_loaded", "Models resident in the registry", lambda: len(loaded_models()))
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/uploads/<path:filename>")
 def serve_upload(filename):
-    return send_from_directory(UPLOAD_DIR, filename)
+    if any(part.startswith(".") for part in filename.split("/")):
+        return jsonify({"error": "not found"}), 404  # hides in-flight temp files
+    path = safe_join(UPLOAD_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        return jsonify({"error": "not found"}), 404
+    stem, _, src_ext = os.path.basename(path).rpartition(".")
+    # sha256-named files never change, so they (and their variants) can be cached forever
+    immutable = len(stem) == 64 and all(c in "0123456789abcdef" for c in stem)
+    if not any(k in request.args for k in VARIANT_PARAMS):
+        resp = send_file(path, etag=stem if immutable else True, conditional=True,
+                         max_age=IMMUTABLE_MAX_AGE if immutable else MUTABLE_MAX_AGE)
+    else:
+        try:
+            width, fmt, quality = parse_params(request.args, src_ext)
+            variant, key = variants.get(path, width, fmt, quality)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Image.DecompressionBombError:
+            return jsonify({"error": "image too large to resize"}), 413
+        except OSError:
+            return jsonify({"error": "could not render variant"}), 415
+        resp = send_file(variant, mimetype=FORMATS[fmt][2], etag=key, conditional=True,
+                         max_age=IMMUTABLE_MAX_AGE if immutable else MUTABLE_MAX_AGE)
+    resp.cache_control.immutable = immutable
+    return resp
 
 def run_flask():
-    app.run(host="127.0.0.1", port=PORT, debug=False, use_reloader=False)
+    job_queue().start()  # resumes jobs left queued or running by a previous run
+    if DETECT_WARMUP:
+        # A dummy frame through the scheduler loads the real backend and warms it up
+        scheduler.submit(np.zeros((DETECT_IMGSZ, DETECT_IMGSZ, 3), np.uint8))
+    app.run(host="127.0.0.1", port=PORT, debug=False, use_reloader=False, threaded=True)
 
 # ------------------ Tkinter GUI ------------------
 class ImageUploader(Frame):
@@ -46,8 +399,9 @@ class ImageUploader(Frame):
         self.pack(fill=BOTH, expand=True)
 
         self.images = []
-        self.tk_images = []
         self.status = StringVar(value=f"Server: http://127.0.0.1:{PORT}/upload")
+        self.ui = TkDispatcher(self)
+        self.engine = UploadEngine(f"http://127.0.0.1:{PORT}/upload", workers=UPLOAD_WORKERS, timeout=10)
 
         # Top bar
         top = Frame(self)
@@ -56,19 +410,20 @@ class ImageUploader(Frame):
         Button(top, text="📂 Browse", command=self.choose).pack(side=RIGHT, padx=4)
         Button(top, text="⬆ Upload", command=self.upload_all).pack(side=RIGHT, padx=4)
         Button(top, text="🗑 Clear", command=self.clear).pack(side=RIGHT, padx=4)
+        Button(top, text="📊 Stats", command=self.toggle_stats).pack(side=RIGHT, padx=4)
+
+        # Stage-timing overlay (hidden until toggled)
+        self.stats_text = StringVar()
+        self.stats_label = Label(self, textvariable=self.stats_text, justify=LEFT, anchor="w",
+                                 font=("Courier", 9), bg="#111", fg="#0f0")
+        self.stats_on = False
 
-        # Gallery
-        cont = Frame(self)
-        cont.pack(fill=BOTH, expand=True, padx=8, pady=8)
-        self.canvas = Canvas(cont, highlightthickness=0)
-        self.scroll = Scrollbar(cont, command=self.canvas.yview)
-        self.canvas.configure(yscrollcommand=self.scroll.set)
-        self.scroll.pack(side=RIGHT, fill=Y)
-        self.canvas.pack(side=LEFT, fill=BOTH, expand=True)
-        self.gallery = Frame(self.canvas)
-        self.canvas.create_window((0, 0), window=self.gallery, anchor=NW)
-        self.gallery.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-        self.canvas.bind_all("<MouseWheel>", self.scroll_y)
+        # Gallery (virtualized; thumbnails decode on a worker pool)
+        self.gallery = VirtualGallery(self, thumb_size=(200, 200), columns=3)
+        self.gallery.pack(fill=BOTH, expand=True, padx=8, pady=8)
+        self.bind_all("<MouseWheel>", self.gallery.on_mousewheel)
+        self.bind_all("<Button-4>", self.gallery.on_mousewheel)
+        self.bind_all("<Button-5>", self.gallery.on_mousewheel)
 
         # URL input
         url_frame = Frame(self)
@@ -78,40 +433,31 @@ class ImageUploader(Frame):
         self.url_entry.pack(side=LEFT, padx=6)
         Button(url_frame, text="🌐 Download from URL", command=self.download_url).pack(side=LEFT)
 
-    def scroll_y(self, e):
-        self.canvas.yview_scroll(int(-1 * (e.delta / 120)), "units")
+    def toggle_stats(self):
+        self.stats_on = not self.stats_on
+        if self.stats_on:
+            self.stats_label.pack(side=TOP, fill=X, padx=8)
+            self._refresh_stats()
+        else:
+            self.stats_label.pack_forget()
+
+    def _refresh_stats(self):
+        if not self.stats_on:
+            return
+        self.stats_text.set(overlay_text())
+        self.after(1000, self._refresh_stats)
 
     def choose(self):
         paths = filedialog.askopenfilenames(filetypes=[("Images", "*.png *.jpg *.jpeg *.webp")])
         if not paths:
             return
-        for p in paths:
-            if p not in self.images:
-                self.images.append(p)
-        self.refresh()
+        new = [p for p in paths if p not in self.images]
+        self.images.extend(new)
+        self.gallery.add(new)
 
     def clear(self):
         self.images = []
-        for w in self.gallery.winfo_children():
-            w.destroy()
-        self.tk_images.clear()
-
-    def refresh(self):
-        for w in self.gallery.winfo_children():
-            w.destroy()
-        self.tk_images.clear()
-        for idx, p in enumerate(self.images):
-            try:
-                im = Image.open(p)
-                im.thumbnail((200, 200))
-                img = ImageTk.PhotoImage(im)
-                self.tk_images.append(img)
-                tile = Frame(self.gallery, bd=1, relief="solid")
-                tile.grid(row=idx // 3, column=idx % 3, padx=5, pady=5)
-                Label(tile, image=img).pack()
-                Label(tile, text=os.path.basename(p)).pack()
-            except Exception as e:
-                print("Error:", e)
+        self.gallery.clear()
 
     def upload_all(self):
         if not self.images:
@@ -121,19 +467,12 @@ class ImageUploader(Frame):
         threading.Thread(target=self.worker, daemon=True).start()
 
     def worker(self):
-        ok, fail = 0, []
-        for path in self.images:
-            try:
-                with open(path, "rb") as f:
-                    files = {"file": (os.path.basename(path), f, "image/jpeg")}
-                    r = requests.post(f"http://127.0.0.1:{PORT}/upload", files=files, timeout=10)
-                if r.ok:
-                    ok += 1
-                else:
-                    fail.append(os.path.basename(path))
-            except Exception:
-                fail.append(os.path.basename(path))
-        self.status.set(f"Uploaded {ok}, failed {len(fail)}")
+        self.engine.upload(list(self.images),
+                           on_progress=self.ui.wrap(self._upload_progress),
+                           on_done=self.ui.wrap(lambda res: self.status.set(summarize(res))))
+
+    def _upload_progress(self, path, state, done, total):
+        self.status.set(f"Uploading {done}/{total} — {os.path.basename(path)}: {state}")
 
     def download_url(self):
         url = self.url_entry.get().strip()
@@ -147,14 +486,13 @@ class ImageUploader(Frame):
         try:
             resp = requests.get(url, stream=True, timeout=10)
             resp.raise_for_status()
-            content_type = resp.headers.get("Content-Type", "")
-            ext = ".jpg" if "jpeg" in content_type else ".png"
-            filename = os.path.join(UPLOAD_DIR, secure_filename(f"{uuid.uuid4().hex}{ext}"))
-            with open(filename, "wb") as f:
-                for chunk in resp.iter_content(8192):
-                    f.write(chunk)
+            rel, _, _ = store_chunks(resp.iter_content(65536), UPLOAD_DIR, MAX_UPLOAD_BYTES)
+            filename = os.path.join(UPLOAD_DIR, *rel.split("/"))
+            if filename in self.images:
+                self.status.set(f"Already downloaded: {os.path.basename(filename)}")
+                return
             self.images.append(filename)
-            self.refresh()
+            self.ui.call(self.gallery.add, [filename])
             self.status.set(f"Downloaded: {os.path.basename(filename)}")
         except Exception as e:
             self.status.set(f"Download failed: {e}")
@@ -0,0 +1,279 @@
+# cascade.py – coarse-to-fine detection: a small model first, the heavy one only where needed.
+# Every image goes through the small model at low resolution. Images (or, with region mode,
+# just the uncertain parts of them) are escalated to the large model at high resolution when
+# the cheap pass is ambiguous: mid-confidence boxes, very small vehicles, or nothing found.
+#
+#   python cascade.py lot_photos/ --small n --large x      # escalation rate, latency and recall vs large-only
+
+import os, json, time, argparse, threading
+from collections import Counter
+import numpy as np
+
+import backends
+from detection import VEHICLE_LABELS, vehicle_class_ids, result_array, filter_classes, boxes_to_dicts
+from tiling import nms
+from metrics import timed, record_yolo_speed, REGISTRY
+
+SMALL_WEIGHTS, SMALL_IMGSZ = "n", 640
+LARGE_WEIGHTS, LARGE_IMGSZ = "x", 1920
+FLOOR_CONF = 0.05          # the small pass keeps weak boxes so ambiguity is visible
+AMBIGUOUS = (0.25, 0.60)   # confidence band that is neither a clear hit nor clear noise
+SMALL_BOX_FRAC = 0.002     # boxes below this fraction of the image area count as small
+REGION_MARGIN = 0.5        # region mode: grow each uncertain box by this fraction per side
+REGION_MIN = 320           # ...and make the crop at least this many pixels wide / tall
+
+ESCALATIONS = REGISTRY.counter("carrec_cascade_images_total", "Cascade images by outcome")
+
+
+class CascadeStats:
+    def __init__(self):
+        self.images = self.escalated = self.regions = 0
+        self.reasons = Counter()
+        self.small_seconds = self.large_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "images": self.images,
+                "escalated": self.escalated,
+                "escalated_fraction": round(self.escalated / self.images, 4) if self.images else 0.0,
+                "regions": self.regions,
+                "reasons": dict(self.reasons),
+                "small_seconds": round(self.small_seconds, 3),
+                "large_seconds": round(self.large_seconds, 3),
+            }
+
+
+def escalation_reasons(data, shape, conf, ambiguous=AMBIGUOUS, small_frac=SMALL_BOX_FRAC, escalate_empty=True):
+    """Why the cheap (N, 6) detections of one image aren't trustworthy (empty list: they are)."""
+    reasons = []
+    scores = data[:, 4]
+    confident = data[scores >= conf]
+    if ((scores >= ambiguous[0]) & (scores < ambiguous[1])).any():
+        reasons.append("ambiguous")
+    if len(data):
+        area = (data[:, 2] - data[:, 0]) * (data[:, 3] - data[:, 1])
+        if (area[scores >= ambiguous[0]] < small_frac * shape[0] * shape[1]).any():
+            reasons.append("small")
+    if escalate_empty and not len(confident):
+        reasons.append("empty")
+    return reasons
+
+
+def uncertain_regions(data, shape, conf, ambiguous=AMBIGUOUS, small_frac=SMALL_BOX_FRAC,
+                      margin=REGION_MARGIN, min_size=REGION_MIN):
+    """Merged crop windows (x0, y0, x1, y1) around ambiguous or small boxes."""
+    h, w = shape[:2]
+    scores = data[:, 4]
+    area = (data[:, 2] - data[:, 0]) * (data[:, 3] - data[:, 1])
+    pick = ((scores >= ambiguous[0]) & (scores < ambiguous[1])) | \
+           ((scores >= ambiguous[0]) & (area < small_frac * h * w))
+    windows = []
+    for x1, y1, x2, y2 in data[pick, :4]:
+        bw, bh = x2 - x1, y2 - y1
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        half_w = max(bw * (1 + 2 * margin), min_size) / 2
+        half_h = max(bh * (1 + 2 * margin), min_size) / 2
+        windows.append([max(0, cx - half_w), max(0, cy - half_h), min(w, cx + half_w), min(h, cy + half_h)])
+    # Union overlapping windows until stable so each area is only run once
+    merged = True
+    while merged and len(windows) > 1:
+        merged = False
+        out = []
+        for win in windows:
+            for o in out:
+                if win[0] < o[2] and o[0] < win[2] and win[1] < o[3] and o[1] < win[3]:
+                    o[:] = [min(o[0], win[0]), min(o[1], win[1]), max(o[2], win[2]), max(o[3], win[3])]
+                    merged = True
+                    break
+            else:
+                out.append(list(win))
+        windows = out
+    return [tuple(int(v) for v in win) for win in windows]
+
+
+class CascadeDetector:
+    def __init__(self, small=SMALL_WEIGHTS, large=LARGE_WEIGHTS, small_imgsz=SMALL_IMGSZ, large_imgsz=LARGE_IMGSZ,
+                 conf=0.20, iou=0.5, labels=VEHICLE_LABELS, backend="auto", device=None,
+                 ambiguous=AMBIGUOUS, small_frac=SMALL_BOX_FRAC, escalate_empty=True, regions=False):
+        """regions=True re-runs only crops around uncertain boxes instead of the whole image.
+
+        Both models load lazily; the large one only when something is first escalated.
+        """
+        self.small, self.large = small, large
+        self.small_imgsz, self.large_imgsz = small_imgsz, large_imgsz
+        self.conf, self.iou = conf, iou
+        self.labels = labels
+        self.backend, self.device = backend, device
+        self.ambiguous, self.small_frac, self.escalate_empty = tuple(ambiguous), small_frac, escalate_empty
+        self.regions = regions
+        self.stats = CascadeStats()
+
+    def _model(self, weights, imgsz):
+        model, device, _ = backends.load(weights, self.backend, imgsz=imgsz, device=self.device)
+        return model, device
+
+    def _predict(self, weights, imgsz, frames, conf):
+        model, device = self._model(weights, imgsz)
+        class_ids = vehicle_class_ids(model.names, self.labels)
+        results = model.predict(frames, conf=conf, iou=self.iou, imgsz=imgsz, classes=class_ids,
+                                device=device, verbose=False)
+        record_yolo_speed(results)
+        return [filter_classes(result_array(r), class_ids) for r in results], model.names
+
+    def detect(self, frames):
+        """Vehicle boxes (JSON dicts, with "stage": "small" | "large") for a list of BGR frames."""
+        t0 = time.perf_counter()
+        with timed("cascade_small"):
+            cheap, names = self._predict(self.small, self.small_imgsz, frames, FLOOR_CONF)
+        t1 = time.perf_counter()
+
+        final = [None] * len(frames)
+        full, crops = [], []  # escalations: whole frames / (frame index, window)
+        reasons_all = Counter()
+        for i, (img, data) in enumerate(zip(frames, cheap)):
+            reasons = escalation_reasons(data, img.shape, self.conf, self.ambiguous, self.small_frac,
+                                         self.escalate_empty)
+            reasons_all.update(reasons)
+            windows = uncertain_regions(data, img.shape, self.conf, self.ambiguous, self.small_frac) \
+                if self.regions and reasons and "empty" not in reasons else []
+            if not reasons:
+                final[i] = (data[data[:, 4] >= self.conf], "small")
+            elif windows:
+                crops += [(i, win) for win in windows]
+            else:
+                full.append(i)
+
+        large_names = names
+        if full:
+            dets, large_names = self._predict(self.large, self.large_imgsz, [frames[i] for i in full], self.conf)
+            for i, data in zip(full, dets):
+                final[i] = (data, "large")
+        if crops:
+            # Crops are small: run them at their own size (capped) rather than upscaling to large_imgsz
+            imgsz = min(self.large_imgsz, max(max(x1 - x0, y1 - y0) for _, (x0, y0, x1, y1) in crops))
+            imgsz = max(32, int(np.ceil(imgsz / 32) * 32))
+            dets, large_names = self._predict(self.large, imgsz,
+                                              [frames[i][y0:y1, x0:x1] for i, (x0, y0, x1, y1) in crops],
+                                              self.conf)
+            by_frame = {}
+            for (i, (x0, y0, _, _)), data in zip(crops, dets):
+                data = data.copy()
+                data[:, [0, 2]] += x0
+                data[:, [1, 3]] += y0
+                by_frame.setdefault(i, []).append(data)
+            windows = {}
+            for i, win in crops:
+                windows.setdefault(i, []).append(win)
+            for i, parts in by_frame.items():
+                data = cheap[i]
+                data = data[data[:, 4] >= self.conf]
+                # Cheap boxes inside a re-run window are superseded by the large model's; every
+                # other cheap box stays, so region mode never reports less than the cheap pass
+                covered = np.zeros(len(data), bool)
+                for x0, y0, x1, y1 in windows[i]:
+                    covered |= (data[:, 0] >= x0) & (data[:, 1] >= y0) & (data[:, 2] <= x1) & (data[:, 3] <= y1)
+                merged = np.concatenate([data[~covered]] + parts)
+                keep = nms(merged[:, :4], merged[:, 4], merged[:, 5].astype(int), self.iou, metric="ios")
+                final[i] = (merged[keep], "region")
+        t2 = time.perf_counter()
+
+        escalated = sum(1 for _, stage in final if stage != "small")
+        with self.stats._lock:
+            self.stats.images += len(frames)
+            self.stats.escalated += escalated
+            self.stats.regions += len(crops)
+            self.stats.reasons.update(reasons_all)
+            self.stats.small_seconds += t1 - t0
+            self.stats.large_seconds += t2 - t1
+        ESCALATIONS.inc(len(frames) - escalated, outcome="small")
+        ESCALATIONS.inc(escalated, outcome="escalated")
+
+        out = []
+        for data, stage in final:
+            boxes = boxes_to_dicts(data, large_names if stage != "small" else names)
+            for b in boxes:
+                b["stage"] = stage
+            out.append(boxes)
+        return out
+
+
+def evaluate(paths, cascade, runs=1):
+    """Cascade vs large-model-only on the same images: latency, escalation rate and recall."""
+    import cv2
+    frames = [img for img in (cv2.imread(p) for p in paths) if img is not None]
+    if not frames:
+        raise FileNotFoundError("no readable images")
+    cascade.detect(frames[:1])  # warm-up / load
+    cascade.stats = CascadeStats()
+    model, device = cascade._model(cascade.large, cascade.large_imgsz)
+    class_ids = vehicle_class_ids(model.names, cascade.labels)
+
+    large_t, cascade_t, recall, ious = [], [], [], []
+    for img in frames:
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            base = filter_classes(result_array(model.predict(img, conf=cascade.conf, iou=cascade.iou,
+                                                             imgsz=cascade.large_imgsz, classes=class_ids,
+                                                             device=device, verbose=False)[0]), class_ids)
+            large_t.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            boxes = cascade.detect([img])[0]
+            cascade_t.append(time.perf_counter() - t0)
+        inv = {n: i for i, n in model.names.items()}
+        other = np.array([[*b["xyxy"], b["conf"], inv[b["label"]]] for b in boxes], np.float32).reshape(-1, 6)
+        r, iou = backends._agreement(base, other)
+        recall.append(r)
+        ious.append(iou)
+    large_ms, cascade_ms = 1000 * np.mean(large_t), 1000 * np.mean(cascade_t)
+    return {
+        "large_only_ms": round(float(large_ms), 2),
+        "cascade_ms": round(float(cascade_ms), 2),
+        "speedup": round(float(large_ms / cascade_ms), 2) if cascade_ms else None,
+        "recall_vs_large": round(float(np.mean(recall)), 4),
+        "mean_iou": round(float(np.mean(ious)), 4),
+        **cascade.stats.as_dict(),
+    }
+
+
+def add_arguments(ap):
+    """Cascade options shared by this CLI and batch_detect.py."""
+    ap.add_argument("--small", default=SMALL_WEIGHTS, help="cheap first-pass model")
+    ap.add_argument("--large", default=LARGE_WEIGHTS, help="model for escalated images / regions")
+    ap.add_argument("--small-imgsz", type=int, default=SMALL_IMGSZ)
+    ap.add_argument("--large-imgsz", type=int, default=LARGE_IMGSZ)
+    ap.add_argument("--ambiguous", default=f"{AMBIGUOUS[0]},{AMBIGUOUS[1]}",
+                    help="confidence band 'lo,hi' that triggers escalation")
+    ap.add_argument("--small-frac", type=float, default=SMALL_BOX_FRAC,
+                    help="boxes smaller than this fraction of the image trigger escalation")
+    ap.add_argument("--no-escalate-empty", action="store_true", help="trust an empty cheap pass")
+    ap.add_argument("--regions", action="store_true", help="escalate only crops around uncertain boxes")
+
+
+def from_args(args, conf, iou, labels=VEHICLE_LABELS, backend="auto", device=None):
+    lo, hi = (float(v) for v in args.ambiguous.split(","))
+    return CascadeDetector(args.small, args.large, args.small_imgsz, args.large_imgsz, conf=conf, iou=iou,
+                           labels=labels, backend=backend, device=device, ambiguous=(lo, hi),
+                           small_frac=args.small_frac, escalate_empty=not args.no_escalate_empty,
+                           regions=args.regions)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Evaluate cascade detection against the large model alone")
+    ap.add_argument("images", help="folder of images")
+    ap.add_argument("--conf", type=float, default=0.20)
+    ap.add_argument("--iou", type=float, default=0.5)
+    ap.add_argument("--backend", choices=("auto",) + backends.BACKENDS, default="auto")
+    ap.add_argument("--device", default=None)
+    ap.add_argument("--runs", type=int, default=1)
+    add_arguments(ap)
+    args = ap.parse_args(argv)
+    paths = sorted(os.path.join(args.images, n) for n in os.listdir(args.images)
+                   if n.lower().endswith((".jpg", ".jpeg", ".png", ".webp")))
+    cascade = from_args(args, args.conf, args.iou, backend=args.backend, device=args.device)
+    print(json.dumps(evaluate(paths, cascade, args.runs), indent=2))
+
+
+if __name__ == "__main__":
+    main()
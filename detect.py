@@ -1,15 +1,16 @@
-from ultralytics import YOLO
 import cv2
 
-# Load YOLOv8 nano model
-model = YOLO("yolov8n.pt")
+import backends
+
+# Load YOLOv8 nano model (CUDA if available, else the fastest CPU backend)
+model, device, backend = backends.load("n")
 
 # Read image
 img = "car.jpg"
 frame = cv2.imread(img)
 
 # Detect cars
-results = model(frame, device=0)  # device=0 => GPU
+results = model(frame, device=device)
 
 # Draw boxes
 annotated = results[0].plot()
@@ -1,19 +1,30 @@
 # detect_cars_gui.py – GUI with real icons instead of emojis
-import os, threading, uuid, requests, cv2
-from tkinter import Tk, Frame, Button, Label, filedialog, StringVar, Entry, BOTH, X, LEFT, PhotoImage
-from PIL import Image, ImageTk
-from ultralytics import YOLO
-import torch
-
-# 🔥 Load YOLO model
-model = YOLO("yolov8x.pt")
-
-# 🚀 Use CUDA if available
-if torch.cuda.is_available():
-    model.to("cuda")
-    print("✅ Using GPU (CUDA)")
-else:
-    print("⚠️ CUDA not available, running on CPU")
+import os, threading
+import numpy as np
+from tkinter import Tk, Frame, Button, Label, Checkbutton, OptionMenu, filedialog, StringVar, BooleanVar, Entry, BOTH, X, LEFT, PhotoImage
+from PIL import ImageTk
+
+from detection import VEHICLE_LABELS, vehicle_boxes, vehicle_class_ids, count_by_label
+from result_cache import DetectionCache, cache_key
+from frame import ImageFrame
+from tk_dispatch import TkDispatcher
+from tiling import tiled_predict, TILE_SIZE, TILE_OVERLAP
+from model_registry import MODEL_SIZES, DEFAULT_SIZE
+import backends
+from metrics import timed, record_yolo_speed, record_detection, overlay_text
+from plates import PlateReader
+from cascade import CascadeDetector, SMALL_WEIGHTS
+from detection_index import DetectionIndex
+
+# 💾 Disk writes are optional: frames live in memory from load to display
+SAVE_DOWNLOADS = False
+SAVE_ANNOTATED = True
+
+# 🔥 YOLO is loaded lazily on first detection (or by the background warm-up below)
+WARMUP_ON_START = True
+
+# ⚙️ Inference backend: auto picks CUDA PyTorch, else OpenVINO / ONNX Runtime on CPU
+BACKEND = "auto"
 
 BASE_DIR = os.path.dirname(__file__)
 UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
@@ -68,8 +79,33 @@ class CarDetector(Frame):
         Button(top, text="From URL", image=self.icon_url,
                command=self.load_from_url, **BTN_STYLE).pack(side=LEFT, padx=5)
 
-        Button(top, text="Detect Vehicles", image=self.icon_detect,
-               command=self.detect_cars, **BTN_STYLE).pack(side=LEFT, padx=5)
+        self.detect_btn = Button(top, text="Detect Vehicles", image=self.icon_detect,
+                                 command=self.detect_cars, **BTN_STYLE)
+        self.detect_btn.pack(side=LEFT, padx=5)
+
+        # 🧠 Model size (n/s/m/l/x), loaded on demand and cached
+        self.model_size = StringVar(value=DEFAULT_SIZE)
+        OptionMenu(top, self.model_size, *MODEL_SIZES).pack(side=LEFT, padx=5)
+
+        # 🧩 Tiled mode: overlapping native-size tiles instead of one 1920 pass
+        self.tiled = BooleanVar(value=False)
+        Checkbutton(top, text="Tiled", variable=self.tiled,
+                    font=("Arial", 12)).pack(side=LEFT, padx=5)
+
+        # 🪜 Cascade: yolov8n at 640 first, the selected model at 1920 only when unsure
+        self.cascade = BooleanVar(value=False)
+        Checkbutton(top, text="Cascade", variable=self.cascade,
+                    font=("Arial", 12)).pack(side=LEFT, padx=5)
+
+        # 🔤 License plates: OCR on vehicle crops only, cached per plate patch
+        self.read_plates = BooleanVar(value=False)
+        Checkbutton(top, text="Plates", variable=self.read_plates,
+                    font=("Arial", 12)).pack(side=LEFT, padx=5)
+
+        # 📊 Per-stage timings (decode / inference / nms / annotate ...) under the status line
+        self.show_stats = BooleanVar(value=False)
+        Checkbutton(top, text="Stats", variable=self.show_stats, command=self._toggle_stats,
+                    font=("Arial", 12)).pack(side=LEFT, padx=5)
 
         Label(
     self,
@@ -80,8 +116,54 @@ class CarDetector(Frame):
     wraplength=900,
     justify="center"
 ).pack(pady=12)
-        self.image_path = None
+        self.stats_text = StringVar()
+        self.stats_label = Label(self, textvariable=self.stats_text, font=("Courier", 10),
+                                 fg="#00ff00", bg="#111111", justify="left")
+        self.frame = None       # current ImageFrame (decoded once)
         self.tk_img = None
+        self.ui = TkDispatcher(self)
+        self.backend_names = {}  # size → backend actually in use
+        self.cache = DetectionCache()
+        self.plates = PlateReader()  # easyocr loads on first use
+        self.cascades = {}           # large model size → CascadeDetector
+        self.index = DetectionIndex()  # 🗂️ every detection is recorded for later queries
+        self.detecting = False  # one detection at a time; extra clicks are ignored
+
+        if WARMUP_ON_START:
+            self.status.set("Warming up model in background...")
+            threading.Thread(target=self._warmup, daemon=True).start()
+
+    def _warmup(self):
+        try:
+            model, device = self._model()
+            # Same input size as Detect, so the first real call doesn't pay for a shape change
+            model.predict(np.zeros((1080, 1920, 3), np.uint8), imgsz=1920, device=device, verbose=False)
+            self._on_warm(None)
+        except Exception as e:
+            self._on_warm(e)
+
+    def _on_warm(self, err):
+        if err:
+            self.status.set(f"⚠️ Model warm-up failed: {err}")
+        elif self.frame is None:
+            self.status.set("✅ Model ready. Choose image or URL")
+
+    def _model(self):
+        """Current model and device; the first call for a size pays the load (and export)."""
+        size = self.model_size.get()
+        if size not in self.backend_names:
+            self.status.set(f"Loading {MODEL_SIZES[size]}...")
+        model, device, name = backends.load(size, BACKEND)
+        self.backend_names[size] = name
+        return model, device
+
+    def _backend_name(self):
+        """Backend for cache keys: what load() picked for the current size, or the planned one
+        before that model is loaded (a cache hit must not load it, nor a cascade's large model)."""
+        size = self.model_size.get()
+        if size in self.backend_names:
+            return self.backend_names[size]
+        return backends.select_backend() if BACKEND == "auto" else BACKEND
 
     def load_icon(self, name):
         path = os.path.join(ICON_DIR, name)
@@ -92,9 +174,9 @@ class CarDetector(Frame):
     def choose_file(self):
         path = filedialog.askopenfilename(filetypes=[("Images", "*.jpg *.jpeg *.png *.webp")])
         if path:
-            self.image_path = path
-            self.display_image(path)
-            self.status.set("✅ Image loaded.")
+            self.status.set("Loading...")
+            threading.Thread(target=self._load_frame, args=(ImageFrame.from_path, path, "✅ Image loaded."),
+                             daemon=True).start()
 
     def load_from_url(self):
         url = self.url_entry.get().strip()
@@ -102,77 +184,121 @@ class CarDetector(Frame):
             self.status.set("Enter image URL.")
             return
         self.status.set("Downloading...")
-        threading.Thread(target=self._download_image, args=(url,), daemon=True).start()
+        load = lambda u: ImageFrame.from_url(u, keep_data=SAVE_DOWNLOADS)  # originals only kept to save them
+        threading.Thread(target=self._load_frame, args=(load, url, "✅ Image downloaded successfully.", SAVE_DOWNLOADS),
+                         daemon=True).start()
 
-    def _download_image(self, url):
+    def _load_frame(self, loader, src, done_msg, save=False):
+        # Decode once, off the Tk thread; the frame is reused for inference and display
         try:
-            headers = {
-                "User-Agent": (
-                    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                    "AppleWebKit/537.36 (KHTML, like Gecko) "
-                    "Chrome/121.0 Safari/537.36"
-                )
-            }
-            r = requests.get(url, stream=True, timeout=10, headers=headers, allow_redirects=True)
-            r.raise_for_status()
-
-            content_type = r.headers.get("Content-Type", "")
-            if not content_type.startswith("image/"):
-                raise ValueError(f"URL is not an image (content-type: {content_type})")
-
-            fname = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}.jpg")
-            with open(fname, "wb") as f:
-                for chunk in r.iter_content(8192):
-                    f.write(chunk)
-
-            self.image_path = fname
-            self.display_image(fname)
-            self.status.set("✅ Image downloaded successfully.")
+            frame = loader(src)
+            if save:
+                frame.save(os.path.join(UPLOAD_DIR, f"{frame.digest[:16]}_{frame.name}"))
+            self.frame = frame
+            self.ui.call(self.display_image, frame)
+            self.status.set(done_msg)
         except Exception as e:
             self.status.set(f"❌ Failed: {e}")
 
-    def display_image(self, path):
-        img = Image.open(path)
-        img.thumbnail((850, 600))
-        self.tk_img = ImageTk.PhotoImage(img)
+    def display_image(self, frame):
+        self.tk_img = ImageTk.PhotoImage(frame.thumbnail((850, 600)))
         self.panel.config(image=self.tk_img)
 
+    def _toggle_stats(self):
+        if self.show_stats.get():
+            self.stats_text.set(overlay_text())
+            self.stats_label.pack(after=self.panel, pady=4)
+        else:
+            self.stats_label.pack_forget()
+
     def detect_cars(self):
-        if not self.image_path:
+        if self.frame is None:
             self.status.set("No image selected.")
             return
+        if self.detecting:
+            self.status.set("⏳ Detection already running...")
+            return
+        self.detecting = True
+        self.detect_btn.config(state="disabled")
         self.status.set("Detecting...")
-        threading.Thread(target=self._detect_worker, daemon=True).start()
+        threading.Thread(target=self._detect_worker, args=(self.frame,), daemon=True).start()
+
+    def _detect_finished(self):
+        self.detecting = False
+        self.detect_btn.config(state="normal")
 
-    def _detect_worker(self):
+    def _detect_worker(self, frame):
         try:
-            results = model.predict(
-                self.image_path,
-                conf=0.20,       # detect small cars
-                iou=0.5,         # less merging
-                imgsz=1920,      # high resolution
-                device=0
-            )
-
-            img = cv2.imread(self.image_path)
-            count = 0
-            for r in results:
-                for b in r.boxes:
-                    cls = int(b.cls[0])
-                    label = r.names[cls]
-                    if label.lower() in ["car", "truck", "bus", "motorbike"]:
-                        count += 1
-                        x1, y1, x2, y2 = map(int, b.xyxy[0])
-                        cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                        cv2.putText(img, f"{count}", (x1, y1 - 5),
-                                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-            out = os.path.join(UPLOAD_DIR, f"detected_{os.path.basename(self.image_path)}")
-            cv2.imwrite(out, img)
-            self.display_image(out)
-            self.status.set(f"✅ Detected {count} vehicles (conf=0.2, res=1920).")
+            tiled = self.tiled.get()
+            cascade = self.cascade.get() and not tiled
+            imgsz = TILE_SIZE if tiled else 1920
+            mode_key = f"tiled:{TILE_OVERLAP}" if tiled else "cascade" if cascade else "full"
+            key = lambda: cache_key(frame.digest, MODEL_SIZES[self.model_size.get()],
+                                    conf=0.20, iou=0.5, imgsz=imgsz, labels=VEHICLE_LABELS,
+                                    mode=mode_key, backend=self._backend_name())
+            with timed("cache"):
+                boxes = self.cache.get(key())
+            cached = boxes is not None
+            if not cached:
+                boxes = self._run_cascade(frame) if cascade else self._run_model(frame, tiled)
+                self.cache.put(key(), boxes)  # re-keyed: load() may have fallen back to PyTorch
+            record_detection(len(boxes))
+            if self.read_plates.get():
+                self.status.set("Reading plates...")
+                boxes = self.plates.read(frame.bgr, [dict(b) for b in boxes])  # don't touch cached dicts
+            with timed("index"):
+                h, w = frame.bgr.shape[:2]
+                self.index.add(frame.digest, boxes, path=frame.name, source="gui", width=w, height=h,
+                               model=f"{SMALL_WEIGHTS}->{self.model_size.get()}" if cascade else self.model_size.get())
+
+            result = frame.annotated(boxes)
+            self.ui.call(self.display_image, result)
+            if SAVE_ANNOTATED:
+                result.save(os.path.join(UPLOAD_DIR, result.name))
+            mode = f"tiled {TILE_SIZE}px, overlap {TILE_OVERLAP}" if tiled else "conf=0.2, res=1920"
+            if cascade:
+                mode = f"cascade {SMALL_WEIGHTS}→{self.model_size.get()}"
+                if self.model_size.get() in self.cascades:
+                    cs = self.cascades[self.model_size.get()].stats.as_dict()
+                    mode += f", {cs['escalated']}/{cs['images']} escalated"
+            mode += f", {self.backend_names.get(self.model_size.get(), BACKEND)}"
+            st = self.cache.stats()
+            hit = " ⚡ cached" if cached else ""
+            by_label = ", ".join(f"{n} {l}" for l, n in count_by_label(boxes).items())
+            read = [b["plate"]["text"] for b in boxes if b.get("plate")]
+            if read:
+                by_label += f"; plates: {', '.join(read)}"
+            self.status.set(f"✅ Detected {len(boxes)} vehicles{f' ({by_label})' if by_label else ''} ({mode}){hit} "
+                            f"[cache {st['hits']} hit / {st['misses']} miss]")
+            if self.show_stats.get():
+                self.ui.call(self.stats_text.set, overlay_text())
         except Exception as e:
             self.status.set(f"Error: {e}")
+        finally:
+            self.ui.call(self._detect_finished)
+
+    def _run_cascade(self, frame):
+        size = self.model_size.get()
+        if size not in self.cascades:
+            self.cascades[size] = CascadeDetector(small=SMALL_WEIGHTS, large=size, large_imgsz=1920, backend=BACKEND)
+        return self.cascades[size].detect([frame.bgr])[0]
+
+    def _run_model(self, frame, tiled):
+        model, device = self._model()
+        if tiled:
+            return tiled_predict(model, frame.bgr, tile=TILE_SIZE, overlap=TILE_OVERLAP,
+                                 conf=0.20, iou=0.5, device=device)
+        results = model.predict(
+            frame.bgr,
+            conf=0.20,       # detect small cars
+            iou=0.5,         # less merging
+            imgsz=1920,      # high resolution
+            classes=vehicle_class_ids(model.names),  # NMS only over vehicle classes
+            device=device,
+            verbose=False
+        )
+        record_yolo_speed(results)
+        return vehicle_boxes(results[0])
 
 def main():
     r = Tk()
@@ -0,0 +1,60 @@
+# detection.py – shared helpers for turning YOLO results into vehicle boxes
+from collections import Counter
+import cv2
+import numpy as np
+
+VEHICLE_LABELS = {"car", "truck", "bus", "motorbike", "motorcycle"}
+BOX_COLOR = (0, 255, 0)
+
+
+def vehicle_class_ids(names, labels=VEHICLE_LABELS):
+    """Class IDs of the model whose names are in `labels` (names is YOLO's id→name dict)."""
+    wanted = {l.lower() for l in labels}
+    return [i for i, n in names.items() if n.lower() in wanted]
+
+
+def result_array(result):
+    """All boxes of one YOLO result as a single (N, 6) float32 host array: x1, y1, x2, y2, conf, cls."""
+    if result.boxes is None or len(result.boxes) == 0:
+        return np.zeros((0, 6), np.float32)
+    data = result.boxes.data.cpu().numpy()  # one device→host copy for the whole frame
+    if data.shape[1] == 7:  # tracker output carries an id column: x1, y1, x2, y2, id, conf, cls
+        data = data[:, [0, 1, 2, 3, 5, 6]]
+    return data
+
+
+def filter_classes(data, class_ids):
+    return data[np.isin(data[:, 5].astype(int), class_ids)]
+
+
+def boxes_to_dicts(data, names):
+    """(N, 6) detections → JSON-friendly dicts; all numeric conversion is done array-wide."""
+    xyxy = data[:, :4].astype(int).tolist()
+    conf = np.round(data[:, 4].astype(float), 4).tolist()
+    cls = data[:, 5].astype(int).tolist()
+    return [{"label": names[c], "conf": p, "xyxy": b} for b, p, c in zip(xyxy, conf, cls)]
+
+
+def count_by_label(boxes):
+    """{label: count} for box dicts, most frequent first."""
+    return dict(Counter(b["label"] for b in boxes).most_common())
+
+
+def vehicle_boxes(result, labels=VEHICLE_LABELS):
+    """Return the vehicle detections of one YOLO result as JSON-friendly dicts.
+
+    When predict() already ran with classes=vehicle_class_ids(...) the mask is a no-op.
+    """
+    data = filter_classes(result_array(result), vehicle_class_ids(result.names, labels))
+    return boxes_to_dicts(data, result.names)
+
+
+def draw_boxes(img, boxes):
+    """Draw numbered vehicle boxes (plus any plate read) onto a BGR image in place."""
+    for idx, b in enumerate(boxes, 1):
+        x1, y1, x2, y2 = b["xyxy"]
+        cv2.rectangle(img, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        tag = f"{idx} {b['plate']['text']}" if b.get("plate") else f"{idx}"
+        cv2.putText(img, tag, (x1, y1 - 5),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.7, BOX_COLOR, 2)
+    return img
@@ -0,0 +1,234 @@
+# detection_index.py – persistent, queryable store of per-image detections.
+# Every detection path (server, jobs, batch CLI, video, GUI) writes one row per image plus one
+# row per box into SQLite, with per-label counts kept alongside so questions like "photos with
+# more than 5 trucks" are an indexed lookup, never a rerun of the model or a directory scan.
+
+import os, time, sqlite3, threading
+from collections import Counter
+
+INDEX_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "detections.sqlite3")
+MAX_PAGE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,          -- sha256 of the image bytes (or source#frame for video)
+    path TEXT,
+    source TEXT NOT NULL,
+    model TEXT,
+    width INTEGER,
+    height INTEGER,
+    count INTEGER NOT NULL,
+    max_conf REAL,
+    ingested REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_ingested ON images (ingested DESC, id DESC);
+CREATE INDEX IF NOT EXISTS images_count ON images (count);
+CREATE INDEX IF NOT EXISTS images_source ON images (source, ingested);
+
+CREATE TABLE IF NOT EXISTS detections (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    conf REAL NOT NULL,
+    x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER,
+    plate TEXT
+);
+CREATE INDEX IF NOT EXISTS detections_image ON detections (image_id);
+CREATE INDEX IF NOT EXISTS detections_label_conf ON detections (label, conf);
+CREATE INDEX IF NOT EXISTS detections_plate ON detections (plate) WHERE plate IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS label_counts (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (image_id, label)
+);
+CREATE INDEX IF NOT EXISTS label_counts_label_n ON label_counts (label, n);
+"""
+
+
+def encode_cursor(ingested, image_id):
+    return f"{ingested!r}:{image_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        ingested, image_id = cursor.rsplit(":", 1)
+        return float(ingested), int(image_id)
+    except (AttributeError, ValueError):
+        raise ValueError("bad cursor") from None
+
+
+class DetectionIndex:
+    def __init__(self, path=INDEX_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    # ----- writes -----
+    def add(self, key, boxes, path=None, source="api", model=None, width=None, height=None):
+        self.add_many([{"key": key, "boxes": boxes, "path": path, "source": source, "model": model,
+                        "width": width, "height": height}])
+
+    def add_many(self, records):
+        """Upsert many images in one transaction; each record has key and boxes, plus optional
+        path / source / model / width / height. Re-adding a key replaces its detections."""
+        now = time.time()
+        with self._lock, self._db:
+            for r in records:
+                boxes = r["boxes"]
+                row = self._db.execute(
+                    "INSERT INTO images (key, path, source, model, width, height, count, max_conf, ingested) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET path=COALESCE(excluded.path, path), source=excluded.source, "
+                    "model=excluded.model, width=excluded.width, height=excluded.height, count=excluded.count, "
+                    "max_conf=excluded.max_conf, ingested=excluded.ingested RETURNING id",
+                    (r["key"], r.get("path"), r.get("source", "api"), r.get("model"), r.get("width"),
+                     r.get("height"), len(boxes), max((b["conf"] for b in boxes), default=None), now)).fetchone()
+                image_id = row[0]
+                self._db.execute("DELETE FROM detections WHERE image_id=?", (image_id,))
+                self._db.execute("DELETE FROM label_counts WHERE image_id=?", (image_id,))
+                self._db.executemany(
+                    "INSERT INTO detections (image_id, label, conf, x1, y1, x2, y2, plate) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(image_id, b["label"], b["conf"], *b["xyxy"], (b.get("plate") or {}).get("text"))
+                     for b in boxes])
+                self._db.executemany("INSERT INTO label_counts (image_id, label, n) VALUES (?, ?, ?)",
+                                     [(image_id, label, n) for label, n in Counter(b["label"] for b in boxes).items()])
+
+    # ----- reads -----
+    def query(self, label=None, min_count=None, max_count=None, min_conf=None, plate=None, source=None,
+              since=None, until=None, limit=50, cursor=None):
+        """Newest-first page of images matching every given filter.
+
+        With label, min_count / max_count apply to that label's count, otherwise to all vehicles.
+        Returns (items, next_cursor); pass next_cursor back to continue (keyset pagination).
+        """
+        limit = max(1, min(int(limit), MAX_PAGE))
+        joins, where, args = [], [], []
+        if label is not None:
+            joins.append("JOIN label_counts lc ON lc.image_id = i.id AND lc.label = ?")
+            args.append(label)
+            count_col = "lc.n"
+        else:
+            count_col = "i.count"
+        if min_count is not None:
+            where.append(f"{count_col} >= ?")
+            args.append(int(min_count))
+        if max_count is not None:
+            if label is not None:
+                # images without any box of the label have no label_counts row
+                raise ValueError("max_count with label is not supported; use min_count")
+            where.append(f"{count_col} <= ?")
+            args.append(int(max_count))
+        if min_conf is not None:
+            sub = "EXISTS (SELECT 1 FROM detections d WHERE d.image_id = i.id AND d.conf >= ?"
+            args.append(float(min_conf))
+            if label is not None:
+                sub += " AND d.label = ?"
+                args.append(label)
+            where.append(sub + ")")
+        if plate:
+            where.append("EXISTS (SELECT 1 FROM detections d WHERE d.image_id = i.id AND d.plate = ?)")
+            args.append("".join(c for c in plate.upper() if c.isalnum()))
+        if source:
+            where.append("i.source = ?")
+            args.append(source)
+        if since is not None:
+            where.append("i.ingested >= ?")
+            args.append(float(since))
+        if until is not None:
+            where.append("i.ingested < ?")
+            args.append(float(until))
+        if cursor:
+            ingested, image_id = decode_cursor(cursor)
+            where.append("(i.ingested < ? OR (i.ingested = ? AND i.id < ?))")
+            args += [ingested, ingested, image_id]
+        sql = (f"SELECT i.*, {count_col} AS matched FROM images i {' '.join(joins)} "
+               f"{'WHERE ' + ' AND '.join(where) if where else ''} "
+               "ORDER BY i.ingested DESC, i.id DESC LIMIT ?")
+        with self._lock:
+            rows = self._db.execute(sql, args + [limit + 1]).fetchall()
+            items = [self._image_dict(r) for r in rows[:limit]]
+            self._attach_labels(items)
+        nxt = encode_cursor(rows[limit - 1]["ingested"], rows[limit - 1]["id"]) if len(rows) > limit else None
+        return items, nxt
+
+    def recent(self, limit=20):
+        return self.query(limit=limit)[0]
+
+    def has(self, key):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM images WHERE key = ?", (key,)).fetchone() is not None
+
+    def get(self, key):
+        """One image with all its boxes, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT *, count AS matched FROM images WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            item = self._image_dict(row)
+            boxes = self._db.execute("SELECT label, conf, x1, y1, x2, y2, plate FROM detections "
+                                     "WHERE image_id = ? ORDER BY conf DESC", (row["id"],)).fetchall()
+        item["boxes"] = [{"label": b["label"], "conf": b["conf"], "xyxy": [b["x1"], b["y1"], b["x2"], b["y2"]],
+                          **({"plate": b["plate"]} if b["plate"] else {})} for b in boxes]
+        return item
+
+    def aggregate(self, by="label", source=None, since=None, until=None):
+        """Totals grouped by label, source or day (UTC); all answered from indexes / counts."""
+        where, args = [], []
+        if source:
+            where.append("i.source = ?")
+            args.append(source)
+        if since is not None:
+            where.append("i.ingested >= ?")
+            args.append(float(since))
+        if until is not None:
+            where.append("i.ingested < ?")
+            args.append(float(until))
+        cond = ("WHERE " + " AND ".join(where)) if where else ""
+        if by == "label":
+            sql = (f"SELECT lc.label AS grp, COUNT(*) AS images, SUM(lc.n) AS vehicles, MAX(lc.n) AS max_per_image "
+                   f"FROM label_counts lc JOIN images i ON i.id = lc.image_id {cond} GROUP BY lc.label "
+                   "ORDER BY vehicles DESC")
+        elif by in ("source", "day"):
+            grp = "i.source" if by == "source" else "date(i.ingested, 'unixepoch')"
+            sql = (f"SELECT {grp} AS grp, COUNT(*) AS images, SUM(i.count) AS vehicles, MAX(i.count) AS max_per_image "
+                   f"FROM images i {cond} GROUP BY grp ORDER BY grp DESC")
+        else:
+            raise ValueError("by must be label, source or day")
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [{by: r["grp"], "images": r["images"], "vehicles": r["vehicles"] or 0,
+                 "max_per_image": r["max_per_image"] or 0} for r in rows]
+
+    def totals(self):
+        with self._lock:
+            row = self._db.execute("SELECT COUNT(*) AS images, COALESCE(SUM(count), 0) AS vehicles FROM images").fetchone()
+        return {"images": row["images"], "vehicles": row["vehicles"]}
+
+    # ----- helpers -----
+    @staticmethod
+    def _image_dict(row):
+        return {"key": row["key"], "path": row["path"], "source": row["source"], "model": row["model"],
+                "width": row["width"], "height": row["height"], "count": row["count"], "matched": row["matched"],
+                "max_conf": row["max_conf"], "ingested": row["ingested"], "id": row["id"]}
+
+    def _attach_labels(self, items):
+        """Per-label counts for a page of images in one query; caller holds the lock."""
+        if not items:
+            return
+        ids = [it["id"] for it in items]
+        rows = self._db.execute(f"SELECT image_id, label, n FROM label_counts WHERE image_id IN "
+                                f"({','.join('?' * len(ids))})", ids).fetchall()
+        by_id = {}
+        for r in rows:
+            by_id.setdefault(r["image_id"], {})[r["label"]] = r["n"]
+        for it in items:
+            it["labels"] = by_id.get(it["id"], {})
@@ -0,0 +1,145 @@
+# frame.py – one decoded image that flows from load → inference → annotation → display.
+# The source bytes are decoded exactly once; thumbnails, encoded bytes and the content digest
+# are derived lazily and cached on the object, and nothing touches the disk unless asked.
+
+import os, io, hashlib
+from urllib.parse import urlparse
+import cv2
+import numpy as np
+import requests
+from PIL import Image
+
+from detection import draw_boxes
+from metrics import timed
+
+MAX_DOWNLOAD_BYTES = 50 * 1024 * 1024
+# Leading magic bytes → extension; URL paths like photo.php say nothing about the pixels
+MAGIC = ((b"\xff\xd8\xff", ".jpg"), (b"\x89PNG", ".png"), (b"BM", ".bmp"), (b"II*\x00", ".tif"), (b"MM\x00*", ".tif"))
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+BROWSER_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/121.0 Safari/537.36"
+    )
+}
+
+
+def sniff_ext(data, default=".jpg"):
+    """Image file extension from the first bytes of encoded data."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp"
+    for magic, ext in MAGIC:
+        if data.startswith(magic):
+            return ext
+    return default
+
+
+def image_name(name, data):
+    """name with an extension matching the actual image type (keeps .jpeg / .jpg as given)."""
+    stem, ext = os.path.splitext(name)
+    real = sniff_ext(data)
+    if ext.lower() == real or {ext.lower(), real} <= {".jpg", ".jpeg"} or {ext.lower(), real} <= {".tif", ".tiff"}:
+        return name
+    return (stem or "image") + real
+
+
+class ImageFrame:
+    def __init__(self, bgr, data=None, name="image.jpg", digest=None):
+        """bgr is the decoded OpenCV array; data the original encoded bytes, if kept."""
+        self.bgr = bgr
+        self.data = data
+        self.name = name
+        self._digest = digest
+        self._thumbs = {}
+        self._encoded = {}
+
+    # ----- constructors -----
+    @classmethod
+    def from_bytes(cls, data, name="image.jpg", keep_data=False):
+        """Decode; the encoded bytes are hashed now and dropped unless keep_data (only needed
+        to save the original file byte-for-byte), so a frame holds just its pixels."""
+        with timed("decode"):
+            bgr = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError(f"cannot decode image: {name}")
+        return cls(bgr, data if keep_data else None, image_name(name, data), hashlib.sha256(data).hexdigest())
+
+    @classmethod
+    def from_path(cls, path, keep_data=False):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read(), os.path.basename(path), keep_data)
+
+    @classmethod
+    def from_url(cls, url, timeout=10, session=None, max_bytes=MAX_DOWNLOAD_BYTES, keep_data=False):
+        """Download into memory (never to disk) and decode."""
+        get = (session or requests).get
+        with timed("download"):
+            r = get(url, stream=True, timeout=timeout, headers=BROWSER_HEADERS, allow_redirects=True)
+            r.raise_for_status()
+            content_type = r.headers.get("Content-Type", "")
+            if not content_type.startswith("image/"):
+                raise ValueError(f"URL is not an image (content-type: {content_type})")
+            buf = io.BytesIO()
+            for chunk in r.iter_content(65536):
+                buf.write(chunk)
+                if buf.tell() > max_bytes:
+                    raise ValueError("image too large")
+        name = os.path.basename(urlparse(url).path) or "download.jpg"
+        return cls.from_bytes(buf.getvalue(), name, keep_data)
+
+    # ----- derived views (computed once) -----
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    @property
+    def digest(self):
+        """sha256 of the original bytes (or of the PNG encoding for in-memory frames)."""
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.data if self.data is not None else self.encoded(".png")).hexdigest()
+        return self._digest
+
+    def thumbnail(self, size):
+        """PIL RGB image fitting inside size=(w, h); never upscales."""
+        if size not in self._thumbs:
+            h, w = self.bgr.shape[:2]
+            scale = min(size[0] / w, size[1] / h, 1.0)
+            small = self.bgr
+            if scale < 1.0:
+                small = cv2.resize(self.bgr, (max(1, int(w * scale)), max(1, int(h * scale))),
+                                   interpolation=cv2.INTER_AREA)
+            self._thumbs[size] = Image.fromarray(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+        return self._thumbs[size]
+
+    def encoded(self, ext=".jpg", quality=92):
+        key = (ext, quality)
+        if key not in self._encoded:
+            params = [cv2.IMWRITE_JPEG_QUALITY, quality] if ext in (".jpg", ".jpeg") else []
+            with timed("encode"):
+                ok, buf = cv2.imencode(ext, self.bgr, params)
+            if not ok:
+                raise ValueError(f"cannot encode as {ext}")
+            self._encoded[key] = buf.tobytes()
+        return self._encoded[key]
+
+    # ----- derived frames / output -----
+    def annotated(self, boxes):
+        """New frame with boxes drawn on a copy of the pixels."""
+        with timed("annotate"):
+            return ImageFrame(draw_boxes(self.bgr.copy(), boxes), name=f"detected_{self.name}")
+
+    def save(self, path):
+        """Write to disk; reuses the original bytes when the extension matches.
+        Encoding happens first, so an unsupported extension never leaves an empty file behind."""
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in IMAGE_EXTS:
+            ext = ".jpg"
+            path += ext
+        src_ext = os.path.splitext(self.name)[1].lower()
+        same = self.data is not None and (ext == src_ext or {ext, src_ext} <= {".jpg", ".jpeg"})
+        data = self.data if same else self.encoded(ext)
+        with timed("write"):
+            with open(path, "wb") as f:
+                f.write(data)
+        return path
@@ -0,0 +1,163 @@
+# gallery.py – virtualized thumbnail grid for the Tk GUIs.
+# Tiles are drawn straight onto one Canvas and only the rows in (or next to) the viewport
+# exist at any time: scrolling recycles canvas items and PhotoImages, so memory stays flat
+# whether 5 or 5000 images are selected. Thumbnails arrive asynchronously from ThumbnailCache.
+
+import os
+from tkinter import Frame, Canvas, Scrollbar, BOTH, RIGHT, LEFT, Y
+from PIL import ImageTk
+
+from thumbnails import ThumbnailCache, THUMB_SIZE
+from tk_dispatch import TkDispatcher
+
+CAPTION_H = 34
+OVERSCAN_ROWS = 1  # rows rendered above/below the viewport so scrolling doesn't flash
+
+
+class VirtualGallery(Frame):
+    def __init__(self, master, thumbs=None, thumb_size=THUMB_SIZE, pad=8, columns=None, **kw):
+        """columns=None fits as many columns as the width allows."""
+        super().__init__(master, **kw)
+        self.thumbs = thumbs or ThumbnailCache(size=thumb_size)
+        self.thumb_w, self.thumb_h = thumb_size
+        self.pad = pad
+        self.fixed_columns = columns
+        self.cell_w = self.thumb_w + 2 * pad
+        self.cell_h = self.thumb_h + CAPTION_H + 2 * pad
+        self.paths = []
+        self._index = set()
+        self._visible = {}    # item index → (canvas ids, PhotoImage or None)
+        self._render_job = None
+        self._laid_out_columns = None
+        self.ui = TkDispatcher(self, interval_ms=15)
+
+        self.canvas = Canvas(self, highlightthickness=0)
+        self.scrollbar = Scrollbar(self, orient="vertical", command=self._yview)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side=RIGHT, fill=Y)
+        self.canvas.pack(side=LEFT, fill=BOTH, expand=True)
+        self.canvas.bind("<Configure>", lambda e: self._relayout())
+
+    # ----- public API -----
+    def add(self, paths):
+        """Append new paths; only tiles that land in the viewport are drawn."""
+        new = [p for p in paths if p not in self._index]
+        self.paths.extend(new)
+        self._index.update(new)
+        self._update_scrollregion()
+        self.schedule_render()
+        return len(new)
+
+    def clear(self):
+        self.paths = []
+        self._index.clear()
+        for idx in list(self._visible):
+            self._drop(idx)
+        self.thumbs.forget()
+        self.canvas.yview_moveto(0)
+        self._update_scrollregion()
+
+    def scroll(self, units):
+        self.canvas.yview_scroll(units, "units")
+        self.schedule_render()
+
+    def on_mousewheel(self, event):
+        """Bindable handler covering Windows/Mac delta and Linux Button-4/5."""
+        if event.num == 4:
+            units = -1
+        elif event.num == 5:
+            units = 1
+        else:
+            units = -1 if event.delta > 0 else 1
+        self.scroll(units)
+
+    def close(self):
+        self.thumbs.close()
+
+    # ----- layout -----
+    @property
+    def columns(self):
+        if self.fixed_columns:
+            return self.fixed_columns
+        return max(1, self.canvas.winfo_width() // self.cell_w)
+
+    def _rows(self):
+        return -(-len(self.paths) // self.columns)
+
+    def _update_scrollregion(self):
+        width = self.columns * self.cell_w
+        self.canvas.configure(scrollregion=(0, 0, width, max(self._rows() * self.cell_h, 1)),
+                              yscrollincrement=self.cell_h // 4)
+
+    def _relayout(self):
+        if self.columns != self._laid_out_columns:
+            # Every tile moves when the column count changes, so redraw from scratch
+            self._laid_out_columns = self.columns
+            for idx in list(self._visible):
+                self._drop(idx)
+        self._update_scrollregion()
+        self.schedule_render()
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_render()
+
+    def schedule_render(self):
+        if self._render_job is None:
+            self._render_job = self.after_idle(self._render)
+
+    # ----- rendering -----
+    def _visible_range(self):
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        first_row = max(0, int(top // self.cell_h) - OVERSCAN_ROWS)
+        last_row = int((top + height) // self.cell_h) + OVERSCAN_ROWS
+        cols = self.columns
+        return first_row * cols, min(len(self.paths), (last_row + 1) * cols)
+
+    def _render(self):
+        self._render_job = None
+        start, stop = self._visible_range()
+        for idx in [i for i in self._visible if not start <= i < stop]:
+            self._drop(idx)
+        for idx in range(start, stop):
+            if idx not in self._visible:
+                self._draw(idx)
+
+    def _cell_origin(self, idx):
+        row, col = divmod(idx, self.columns)
+        return col * self.cell_w + self.pad, row * self.cell_h + self.pad
+
+    def _draw(self, idx):
+        path = self.paths[idx]
+        x, y = self._cell_origin(idx)
+        frame = self.canvas.create_rectangle(x - 1, y - 1, x + self.thumb_w + 1, y + self.thumb_h + 1,
+                                             outline="#999", fill="#e8e8e8")
+        caption = self.canvas.create_text(x + self.thumb_w // 2, y + self.thumb_h + 4, anchor="n",
+                                          text=os.path.basename(path), width=self.thumb_w, justify="center")
+        self._visible[idx] = ([frame, caption], None)
+        img = self.thumbs.cached(path)
+        if img is not None:
+            self._show(idx, path, img)
+        else:
+            self.thumbs.request(path, self.ui.wrap(lambda p, im, i=idx: self._show(i, p, im)))
+
+    def _show(self, idx, path, img):
+        # The tile may have scrolled away (or the list changed) while decoding
+        entry = self._visible.get(idx)
+        if entry is None or idx >= len(self.paths) or self.paths[idx] != path or entry[1] is not None:
+            return
+        ids, _ = entry
+        x, y = self._cell_origin(idx)
+        cx, cy = x + self.thumb_w // 2, y + self.thumb_h // 2
+        if img is None:
+            ids.append(self.canvas.create_text(cx, cy, text="⚠️ unreadable", fill="#a00"))
+            return
+        photo = ImageTk.PhotoImage(img)
+        ids.append(self.canvas.create_image(cx, cy, image=photo))
+        self._visible[idx] = (ids, photo)
+
+    def _drop(self, idx):
+        ids, _ = self._visible.pop(idx)
+        for item in ids:
+            self.canvas.delete(item)
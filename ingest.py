@@ -0,0 +1,424 @@
+# ingest.py – bulk ingestion of dealership listing pages.
+# A saved listing page (or a sitemap) is stream-parsed for vehicle image URLs: <img> src,
+# srcset and lazy-load attributes, <source srcset>, og:image, and URLs inside inline JSON /
+# JSON-LD. Images are fetched concurrently by a pooled aiohttp client (requests + threads when
+# aiohttp isn't installed) with per-host connection limits and ETag / If-Modified-Since
+# revalidation against cache/fetch, and each file goes straight into batch_detect.run.
+#
+#   python ingest.py used-car-dealership-artesia.html --base https://www.casahondanm.com/ --out ingest/
+#   python ingest.py https://dealer.example/sitemap.xml --follow --index --weights n
+
+import os, re, json, time, queue, codecs, asyncio, hashlib, argparse, threading
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from collections import defaultdict
+import xml.etree.ElementTree as ET
+
+from metrics import timed, REGISTRY, BYTES_WRITTEN
+from batch_detect import run, add_detector_arguments, detector_from_args
+
+FETCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "fetch")
+CHUNK = 64 * 1024
+MAX_CONNECTIONS = 32
+PER_HOST = 6            # be polite to the dealer's server / CDN
+TIMEOUT_S = 30
+USER_AGENT = "car-recognision-ingest/1.0"
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+LAZY_ATTRS = ("data-src", "data-lazy", "data-lazy-src", "data-original", "data-srcset", "data-lazy-srcset")
+# Default filter: listing photos live under an inventory-style path or a 17-character VIN folder;
+# stock art elsewhere on the page (warranty banners, test-drive teasers) does not
+VEHICLE_PATH_RE = re.compile(r"inventory|vehicle|/photos?/|/vin/|/stock/|/[a-hj-npr-z0-9]{17}/", re.I)
+# Page furniture that is never a vehicle photo
+SKIP_RE = re.compile(r"logo|icon|sprite|skeleton|placeholder|banner|badge|btn|ribbon|background|/assets/", re.I)
+# Image URLs inside scripts, including JSON-escaped ones (https:\/\/… and \"…\")
+SCRIPT_URL_RE = re.compile(r"""(?:https?:)?(?:\\?/){2}[^\s"'<>\\]+(?:\\/[^\s"'<>\\]+)*?\.(?:jpe?g|png|webp)\b""", re.I)
+
+FETCHES = REGISTRY.counter("carrec_ingest_fetches_total", "Listing-ingest HTTP fetches by outcome")
+
+
+def parse_srcset(value):
+    """The largest candidate of a srcset ("a.jpg 480w, b.jpg 1080w" → "b.jpg")."""
+    best, best_size = None, -1.0
+    for part in value.split(","):
+        bits = part.strip().split()
+        if not bits:
+            continue
+        size = 1.0
+        if len(bits) > 1 and bits[1][-1:] in ("w", "x"):
+            try:
+                size = float(bits[1][:-1])
+            except ValueError:
+                pass
+        if size > best_size:
+            best, best_size = bits[0], size
+    return best
+
+
+def looks_like_vehicle(url, pattern=None):
+    path = urlsplit(url).path.lower()
+    if pattern is not None:
+        return re.search(pattern, url) is not None
+    return path.endswith(IMAGE_EXTS) and bool(VEHICLE_PATH_RE.search(path)) and not SKIP_RE.search(path)
+
+
+class ListingImageParser(HTMLParser):
+    """Collects candidate image URLs (document order, deduplicated) as markup is fed in."""
+
+    def __init__(self, base=None):
+        super().__init__(convert_charrefs=True)
+        self.base = base
+        self.urls = {}            # dict as an ordered set
+        self._in_script = False
+
+    def _add(self, url):
+        if not url or url.startswith("data:"):
+            return
+        url = url.strip().replace("\\/", "/")
+        if url.startswith("//"):
+            url = "https:" + url
+        elif not urlsplit(url).scheme:
+            if not self.base:
+                return  # relative URL and nothing to resolve it against
+            url = urljoin(self.base, url)
+        self.urls.setdefault(url, None)
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag == "base" and a.get("href") and not self.base:
+            self.base = a["href"]
+        elif tag == "link" and a.get("rel") == "canonical" and a.get("href") and not self.base:
+            self.base = a["href"]
+        elif tag == "meta" and a.get("property", a.get("name")) in ("og:image", "twitter:image"):
+            self._add(a.get("content"))
+        elif tag in ("img", "source"):
+            for name in LAZY_ATTRS:
+                if a.get(name):
+                    self._add(parse_srcset(a[name]) if "srcset" in name else a[name])
+            if a.get("srcset"):
+                self._add(parse_srcset(a["srcset"]))
+            if tag == "img":
+                self._add(a.get("src"))
+        elif tag == "script":
+            self._in_script = True
+
+    def handle_endtag(self, tag):
+        if tag == "script":
+            self._in_script = False
+
+    def handle_data(self, data):
+        if self._in_script:
+            for m in SCRIPT_URL_RE.finditer(data):
+                self._add(m.group(0))
+
+
+def extract_image_urls(source, base=None, pattern=None, chunk=CHUNK):
+    """Vehicle image URLs from an HTML file path or binary stream, parsed chunk by chunk.
+
+    Script text is scanned per chunk, so a URL split across two chunks of one script is missed;
+    64 KiB chunks make that rare, and listing pages repeat each photo URL several times anyway.
+    """
+    parser = ListingImageParser(base)
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")  # carries multi-byte chars across chunks
+    f = open(source, "rb") if isinstance(source, (str, os.PathLike)) else source
+    try:
+        for block in iter(lambda: f.read(chunk), b""):
+            parser.feed(decoder.decode(block))
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+    finally:
+        if f is not source:
+            f.close()
+    return [u for u in parser.urls if looks_like_vehicle(u, pattern)]
+
+
+def iter_sitemap(source):
+    """Stream a sitemap / sitemap index → ("image" | "page" | "sitemap", url) in document order."""
+    kind = "page"
+    for event, el in ET.iterparse(source, events=("start", "end")):
+        tag = el.tag.rsplit("}", 1)[-1]
+        if event == "start":
+            if tag == "sitemapindex":
+                kind = "sitemap"
+            continue
+        if tag == "loc" and el.text:
+            # <image:loc> sits inside <image:image>; plain <loc> belongs to a <url> or <sitemap>
+            yield ("image" if "image" in el.tag.split("}")[0] else kind), el.text.strip()
+        elif tag in ("url", "sitemap"):
+            el.clear()
+
+
+def is_sitemap(path):
+    with open(path, "rb") as f:
+        head = f.read(1024).lower()
+    return b"<urlset" in head or b"<sitemapindex" in head
+
+
+# ------------------ fetching ------------------
+class FetchCache:
+    """Bodies plus their validators (ETag, Last-Modified, sha256) for conditional re-fetches."""
+
+    def __init__(self, directory=FETCH_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _base(self, url):
+        h = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, h[:2], h[2:34])
+
+    def body_path(self, url):
+        ext = os.path.splitext(urlsplit(url).path)[1].lower()
+        return self._base(url) + (ext if ext in IMAGE_EXTS + (".html", ".xml") else ".bin")
+
+    def meta(self, url):
+        try:
+            with open(self._base(url) + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta if os.path.isfile(self.body_path(url)) else None
+
+    def validators(self, url):
+        meta = self.meta(url) or {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def store(self, url, body, headers):
+        path = self.body_path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, path)
+        meta = {"url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                "sha256": hashlib.sha256(body).hexdigest(), "bytes": len(body), "fetched": time.time()}
+        with open(self._base(url) + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        BYTES_WRITTEN.observe(len(body), kind="fetch")
+        return path, meta
+
+
+class FetchResult:
+    __slots__ = ("url", "status", "path", "sha256", "error")
+
+    def __init__(self, url, status, path=None, sha256=None, error=None):
+        self.url, self.status, self.path, self.sha256, self.error = url, status, path, sha256, error
+
+
+def _finish(cache, url, code, body, headers, sent_validators):
+    """Turn one HTTP response into a FetchResult ("fetched" | "revalidated" | "failed")."""
+    if code == 304 and sent_validators:
+        meta = cache.meta(url)
+        if meta:
+            FETCHES.inc(outcome="revalidated")
+            return FetchResult(url, "revalidated", cache.body_path(url), meta["sha256"])
+    if code == 200:
+        path, meta = cache.store(url, body, headers)
+        FETCHES.inc(outcome="fetched")
+        return FetchResult(url, "fetched", path, meta["sha256"])
+    FETCHES.inc(outcome="failed")
+    return FetchResult(url, "failed", error=f"HTTP {code}")
+
+
+async def _fetch_async(urls, cache, on_result, connections, per_host, timeout):
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=connections, limit_per_host=per_host, ttl_dns_cache=300)
+    todo = iter(urls)
+
+    async def worker(session):
+        # A fixed set of workers bounds in-flight requests; on_result may block (backpressure)
+        for url in todo:
+            sent = cache.validators(url)
+            try:
+                with timed("fetch"):
+                    async with session.get(url, headers=sent) as resp:
+                        body = await resp.read() if resp.status == 200 else b""
+                        result = await asyncio.to_thread(_finish, cache, url, resp.status, body,
+                                                         resp.headers, sent)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                FETCHES.inc(outcome="failed")
+                result = FetchResult(url, "failed", error=repr(e))
+            await asyncio.to_thread(on_result, result)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout),
+                                     headers={"User-Agent": USER_AGENT}) as session:
+        await asyncio.gather(*(worker(session) for _ in range(connections)))
+
+
+def _fetch_threads(urls, cache, on_result, connections, per_host, timeout):
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=connections, pool_maxsize=per_host)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    host_slots = defaultdict(lambda: threading.BoundedSemaphore(per_host))
+    lock = threading.Lock()
+
+    def one(url):
+        with lock:
+            slots = host_slots[urlsplit(url).netloc]
+        sent = cache.validators(url)
+        try:
+            with slots, timed("fetch"):
+                resp = session.get(url, headers=sent, timeout=timeout)
+            result = _finish(cache, url, resp.status_code, resp.content, resp.headers, sent)
+        except requests.RequestException as e:
+            FETCHES.inc(outcome="failed")
+            result = FetchResult(url, "failed", error=repr(e))
+        on_result(result)
+
+    with ThreadPoolExecutor(connections) as pool:
+        list(pool.map(one, urls))
+
+
+def fetch_all(urls, on_result, cache=None, connections=MAX_CONNECTIONS, per_host=PER_HOST, timeout=TIMEOUT_S):
+    """Fetch every URL concurrently, calling on_result(FetchResult) from a worker thread.
+
+    Uses aiohttp when it is installed, otherwise a requests session on a thread pool.
+    """
+    cache = cache or FetchCache()
+    try:
+        import aiohttp  # noqa: F401 – optional dependency
+    except ImportError:
+        return _fetch_threads(urls, cache, on_result, connections, per_host, timeout)
+    return asyncio.run(_fetch_async(urls, cache, on_result, connections, per_host, timeout))
+
+
+def fetch_one(url, cache=None, timeout=TIMEOUT_S):
+    out = []
+    fetch_all([url], out.append, cache, connections=1, per_host=1, timeout=timeout)
+    return out[0]
+
+
+# ------------------ source → image URLs ------------------
+def collect_image_urls(source, base=None, pattern=None, follow=False, cache=None, max_pages=200,
+                       connections=MAX_CONNECTIONS, per_host=PER_HOST):
+    """Image URLs from a local / remote listing page or sitemap.
+
+    Sitemaps contribute their <image:loc> entries; with follow=True the pages they list (and
+    nested sitemaps) are fetched concurrently and parsed for images too.
+    """
+    cache = cache or FetchCache()
+    if urlsplit(source).scheme in ("http", "https"):
+        result = fetch_one(source, cache)
+        if result.status == "failed":
+            raise RuntimeError(f"could not fetch {source}: {result.error}")
+        base, path = base or source, result.path
+    else:
+        path = source
+    if not is_sitemap(path):
+        return extract_image_urls(path, base, pattern)
+
+    images, pages, seen = {}, [], set()
+    sitemaps = [path]
+    while sitemaps:
+        nested = []
+        for sm in sitemaps:
+            for kind, url in iter_sitemap(sm):
+                if kind == "image" and looks_like_vehicle(url, pattern):
+                    images.setdefault(url, None)
+                elif kind == "page" and len(pages) < max_pages:
+                    pages.append(url)
+                elif kind == "sitemap" and follow and url not in seen:
+                    seen.add(url)
+                    nested.append(url)
+        fetched = []
+        fetch_all(nested, fetched.append, cache, connections, per_host)
+        sitemaps = [r.path for r in fetched if r.path]
+    if follow and pages:
+        lock = threading.Lock()
+
+        def parse_page(result):
+            if result.path:
+                found = extract_image_urls(result.path, result.url, pattern)
+                with lock:
+                    for u in found:
+                        images.setdefault(u, None)
+
+        fetch_all(pages, parse_page, cache, connections, per_host)
+    return list(images)
+
+
+# ------------------ fetch → detect ------------------
+def ingest(urls, model, out_dir, index=None, skip_indexed=True, cache=None, connections=MAX_CONNECTIONS,
+           per_host=PER_HOST, prefetch=64, **run_kwargs):
+    """Fetch images and run batched detection on them as they arrive; returns a summary dict.
+
+    Images whose bytes are already in the detection index (unchanged on revalidation, or the same
+    photo under another URL) are not detected again unless skip_indexed=False. run_kwargs go to
+    batch_detect.run (batch_size, conf, plates, cascade, executor, ...).
+    """
+    cache = cache or FetchCache()
+    ready = queue.Queue(maxsize=prefetch)  # bounded: fetching waits when detection falls behind
+    counts = defaultdict(int)
+    names = {}   # cache path → source URL, for the JSONL and the index
+    done = object()
+
+    lock = threading.Lock()
+
+    def on_result(result):
+        skip = result.path is None or (skip_indexed and index is not None and index.has(result.sha256))
+        with lock:
+            counts[result.status] += 1
+            if result.path is not None and skip:
+                counts["already_indexed"] += 1
+        if skip:
+            return
+        names[result.path] = result.url
+        ready.put(result.path)
+
+    def fetcher():
+        try:
+            fetch_all(urls, on_result, cache, connections, per_host)
+        finally:
+            ready.put(done)
+
+    t0 = time.perf_counter()
+    threading.Thread(target=fetcher, name="ingest-fetch", daemon=True).start()
+    summary = run(iter(ready.get, done), model, out_dir, index=index, source="ingest", names=names,
+                  root=cache.directory, **run_kwargs)
+    summary.update(urls=len(urls), fetch={k: counts[k] for k in sorted(counts)},
+                   seconds=round(time.perf_counter() - t0, 3))
+    return summary
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(description="Fetch and detect vehicle images from listing pages / sitemaps")
+    ap.add_argument("source", help="saved listing page, sitemap.xml, or an http(s) URL of either")
+    ap.add_argument("--out", default="ingest", help="output directory")
+    ap.add_argument("--base", help="URL that relative image links resolve against (default: page's own)")
+    ap.add_argument("--pattern", help="regex image URLs must match (default: inventory / VIN paths, "
+                                      "minus logos / icons / banners)")
+    ap.add_argument("--follow", action="store_true", help="sitemaps: also fetch listed pages and nested sitemaps")
+    ap.add_argument("--connections", type=int, default=MAX_CONNECTIONS, help="concurrent HTTP connections")
+    ap.add_argument("--per-host", type=int, default=PER_HOST, help="concurrent connections per host")
+    ap.add_argument("--list", action="store_true", help="only print the extracted image URLs")
+    ap.add_argument("--redetect", action="store_true", help="detect images already in the index again")
+    return add_detector_arguments(ap)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if (args.procs or args.cascade) and args.tile:
+        build_parser().error("--procs / --cascade do not support --tile")
+    cache = FetchCache()
+    urls = collect_image_urls(args.source, args.base, args.pattern, args.follow, cache,
+                              connections=args.connections, per_host=args.per_host)
+    if args.list:
+        print("\n".join(urls))
+        return
+    with detector_from_args(args) as (model, run_kwargs, extra):
+        summary = ingest(urls, model, args.out, cache=cache, skip_indexed=not args.redetect,
+                         connections=args.connections, per_host=args.per_host, **run_kwargs)
+    print(json.dumps({**summary, **extra}))
+
+
+if __name__ == "__main__":
+    main()
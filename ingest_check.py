@@ -0,0 +1,151 @@
+# ingest_check.py – end-to-end check of ingest.py against a local stand-in dealer server.
+# A throwaway HTTP server on 127.0.0.1 serves a listing page and synthetic car photos with
+# ETags, so parsing, pooled fetching, per-host limits and 304 revalidation are exercised
+# without network access. Exits non-zero on the first failed check.
+#
+#   python ingest_check.py
+#   python ingest_check.py --weights n     # also run detection + the index on the fetched photos
+
+import io, re, sys, json, time, hashlib, argparse, tempfile, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import cv2
+
+import ingest
+from bench import synthetic_lot
+
+PHOTOS = 6
+PER_HOST = 2
+DELAY_S = 0.05  # per photo response, so concurrent requests overlap
+
+
+def listing_html(port):
+    """Listing page covering every place ingest looks for photos, plus page furniture to skip."""
+    photos = [f"/photos/café-{i}.jpg" for i in range(PHOTOS)]
+    return (f"<html><head><base href='http://127.0.0.1:{port}/'>"
+            f"<meta property='og:image' content='{photos[0]}'></head><body>"
+            "<img src='/static/logo.png' alt='Casa — logo'>"
+            "<img src='/wp-content/uploads/Cars-in-Parking-Lot.jpg'>"  # stock art, not inventory
+            f"<img data-src='{photos[1]}' src='data:image/gif;base64,AA' alt='Śedan'>"
+            f"<img srcset='/photos/thumb-2.jpg 480w, {photos[2]} 1200w'>"  # only the largest is kept
+            f"<picture><source srcset='{photos[3]}'></picture>"
+            f"<img data-lazy-src='{photos[4]}'>"
+            "<script type='application/ld+json'>{\"image\": \"http:\\/\\/127.0.0.1:"
+            f"{port}{photos[5].replace('/', chr(92) + '/')}\"}}</script></body></html>").encode("utf-8")
+
+
+class StandIn:
+    """The dealer site: /listing.html and /photos/*-<n>.jpg, with ETag / If-None-Match support."""
+
+    def __init__(self):
+        self.photos = [cv2.imencode(".jpg", synthetic_lot(640, 480, seed=i))[1].tobytes() for i in range(PHOTOS)]
+        self.counts = {"200": 0, "304": 0}
+        self.active = self.peak = 0
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.handle(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, req):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            m = re.search(r"-(\d+)\.jpg$", req.path)
+            if req.path == "/listing.html":
+                body, etag = listing_html(self.port), None
+            elif m and int(m.group(1)) < PHOTOS:
+                body = self.photos[int(m.group(1))]
+                etag = '"%s"' % hashlib.sha256(body).hexdigest()[:16]
+                time.sleep(DELAY_S)
+            else:
+                req.send_response(404)
+                req.end_headers()
+                return
+            status = 304 if etag and req.headers.get("If-None-Match") == etag else 200
+            with self._lock:
+                self.counts[str(status)] += 1
+            req.send_response(status)
+            if etag:
+                req.send_header("ETag", etag)
+            req.send_header("Content-Length", str(len(body) if status == 200 else 0))
+            req.end_headers()
+            if status == 200:
+                req.wfile.write(body)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def reset(self):
+        with self._lock:
+            self.counts = {"200": 0, "304": 0}
+            self.peak = 0
+
+    def close(self):
+        self.server.shutdown()
+
+
+def check(ok, what, detail=""):
+    print(f"{'ok  ' if ok else 'FAIL'} {what}" + (f" ({detail})" if detail and not ok else ""))
+    if not ok:
+        sys.exit(1)
+
+
+def run_checks(weights=None):
+    site = StandIn()
+    cache = ingest.FetchCache(tempfile.mkdtemp(prefix="ingest_check_fetch_"))
+    try:
+        expected = [f"{site.url}/photos/café-{i}.jpg" for i in range(PHOTOS)]
+        page = listing_html(site.port)
+        urls = ingest.collect_image_urls(f"{site.url}/listing.html", cache=cache, per_host=PER_HOST)
+        check(sorted(urls) == sorted(expected), "listing page yields every photo and skips logo / stock art", urls)
+        # 5-byte chunks split é / Ś / — mid-character; the URLs must come out the same
+        small = ingest.extract_image_urls(io.BytesIO(page), chunk=5)
+        check(sorted(small) == sorted(expected), "multi-byte characters survive chunk boundaries", small)
+
+        for attempt, status, code in ((1, "fetched", "200"), (2, "revalidated", "304")):
+            site.reset()
+            results = []
+            ingest.fetch_all(urls, results.append, cache, connections=8, per_host=PER_HOST)
+            check(all(r.status == status for r in results) and len(results) == PHOTOS,
+                  f"fetch #{attempt}: every photo {status}", [(r.url, r.status, r.error) for r in results])
+            check(site.counts[code] == PHOTOS, f"fetch #{attempt}: server answered {code}", site.counts)
+            check(site.peak <= PER_HOST, f"fetch #{attempt}: at most {PER_HOST} connections to the host",
+                  site.peak)
+
+        if weights:
+            import backends
+            from detection_index import DetectionIndex
+            model, device, _ = backends.load(weights)
+            index = DetectionIndex(tempfile.mktemp(prefix="ingest_check_", suffix=".sqlite3"))
+            out = tempfile.mkdtemp(prefix="ingest_check_out_")
+            first = ingest.ingest(urls, model, out, index=index, cache=cache, per_host=PER_HOST,
+                                  device=device, save_images=False)
+            check(first["images"] == PHOTOS and index.totals()["images"] == PHOTOS,
+                  "ingest detects and indexes every photo", json.dumps(first))
+            again = ingest.ingest(urls, model, out, index=index, cache=cache, per_host=PER_HOST,
+                                  device=device, save_images=False)
+            check(again["images"] == 0 and again["fetch"].get("already_indexed") == PHOTOS,
+                  "second ingest skips photos already in the index", json.dumps(again))
+    finally:
+        site.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Check ingest.py against a local stand-in dealer server")
+    ap.add_argument("--weights", help="also run detection with this model size / weights path")
+    args = ap.parse_args(argv)
+    run_checks(args.weights)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# jobs.py – persistent detection job queue.
+# Jobs live in a SQLite file (state, priority, progress, result), so a restart picks up
+# whatever was queued or still running. A bounded pool of worker threads claims the highest
+# priority job first; queued jobs can be cancelled outright, running ones cooperatively.
+
+import os, json, time, uuid, sqlite3, threading
+
+JOBS_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "jobs.sqlite3")
+JOB_WORKERS = 4
+MAX_QUEUED = 10000
+RETRY_BACKOFF_S = 2       # first retry waits this long, doubling per attempt...
+RETRY_BACKOFF_MAX_S = 300  # ...up to this
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINAL_STATES = {DONE, FAILED, CANCELLED}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,  -- retries wait out their backoff before being claimed again
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pick ON jobs (state, priority DESC, created);
+"""
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    """Handed to the handler: report progress, and poll for cancellation."""
+
+    def __init__(self, queue, job_id, payload):
+        self._queue = queue
+        self.id = job_id
+        self.payload = payload
+
+    def progress(self, fraction):
+        self.check()
+        self._queue._update(self.id, progress=max(0.0, min(1.0, float(fraction))))
+
+    def cancelled(self):
+        return self.id in self._queue._cancel_requested
+
+    def check(self):
+        if self.cancelled():
+            raise JobCancelled(self.id)
+
+
+class JobQueue:
+    def __init__(self, handler, path=JOBS_DB, workers=JOB_WORKERS, max_queued=MAX_QUEUED, max_attempts=3):
+        """handler(ctx) -> JSON-serializable result; it runs on one of `workers` threads."""
+        self.handler = handler
+        self.path = path
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        if "not_before" not in {r["name"] for r in self._db.execute("PRAGMA table_info(jobs)")}:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0")  # older DB file
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._cancel_requested = set()
+        self._threads = []
+        self._stopping = False
+        self.version = 0  # bumped on every state change, for SSE waiters
+
+    # ----- lifecycle -----
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            # Anything "running" belonged to a process that died: put it back in line
+            self._db.execute("UPDATE jobs SET state=?, progress=0, updated=? WHERE state=?",
+                             (QUEUED, time.time(), RUNNING))
+            self._stopping = False
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def stop(self, wait=True):
+        with self._changed:
+            self._stopping = True
+            self._changed.notify_all()
+        if wait:
+            for t in self._threads:
+                t.join()
+        self._threads = []
+
+    # ----- client API -----
+    def submit(self, payload, priority=0, kind="detect"):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._changed:
+            queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE state=?", (QUEUED,)).fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFull(f"{queued} jobs already queued")
+            self._db.execute("INSERT INTO jobs (id, kind, payload, priority, state, created, updated) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (job_id, kind, json.dumps(payload), int(priority), QUEUED, now, now))
+            self.version += 1
+            self._changed.notify_all()
+        return job_id
+
+    def cancel(self, job_id):
+        """True if the job was queued or running; running jobs stop at their next progress check."""
+        with self._changed:
+            row = self._db.execute("SELECT state FROM jobs WHERE id=?", (job_id,)).fetchone()
+            if row is None or row["state"] in FINAL_STATES:
+                return False
+            if row["state"] == QUEUED:
+                self._set(job_id, state=CANCELLED)
+            else:
+                self._cancel_requested.add(job_id)
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, state=None, limit=50, offset=0):
+        sql, args = "SELECT * FROM jobs", []
+        if state:
+            sql += " WHERE state=?"
+            args.append(state)
+        sql += " ORDER BY created DESC LIMIT ? OFFSET ?"
+        args += [int(limit), int(offset)]
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [self._to_dict(r, with_result=False) for r in rows]
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        return {r["state"]: r["n"] for r in rows}
+
+    def wait_change(self, version, timeout):
+        """Block until version moves past `version` (or timeout); returns the current version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    # ----- internals -----
+    @staticmethod
+    def _to_dict(row, with_result=True):
+        job = {k: row[k] for k in ("id", "kind", "priority", "state", "progress", "error", "attempts",
+                                   "not_before", "created", "updated")}
+        job["payload"] = json.loads(row["payload"])
+        if with_result:
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
+
+    def _set(self, job_id, **fields):
+        """Update columns; caller holds the lock."""
+        fields["updated"] = time.time()
+        cols = ", ".join(f"{k}=?" for k in fields)
+        self._db.execute(f"UPDATE jobs SET {cols} WHERE id=?", (*fields.values(), job_id))
+        self.version += 1
+        self._changed.notify_all()
+
+    def _update(self, job_id, **fields):
+        with self._changed:
+            self._set(job_id, **fields)
+
+    def _claim(self):
+        """Highest-priority, oldest queued job past its backoff → running; None when there is nothing to do."""
+        row = self._db.execute("SELECT * FROM jobs WHERE state=? AND not_before<=? ORDER BY priority DESC, created "
+                               "LIMIT 1", (QUEUED, time.time())).fetchone()
+        if row is None:
+            return None
+        self._set(row["id"], state=RUNNING, attempts=row["attempts"] + 1)
+        return row
+
+    def _next_retry_in(self):
+        """Seconds until the earliest backed-off job becomes claimable; None if none is waiting."""
+        now = time.time()
+        at = self._db.execute("SELECT MIN(not_before) FROM jobs WHERE state=? AND not_before>?",
+                              (QUEUED, now)).fetchone()[0]
+        return None if at is None else at - now
+
+    def _worker(self):
+        while True:
+            with self._changed:
+                row = None
+                while not self._stopping and (row := self._claim()) is None:
+                    self._changed.wait(self._next_retry_in())
+                if self._stopping:
+                    return
+            job_id = row["id"]
+            ctx = JobContext(self, job_id, json.loads(row["payload"]))
+            try:
+                result = self.handler(ctx)
+                ctx.check()
+                self._update(job_id, state=DONE, progress=1.0, result=json.dumps(result), error=None)
+            except JobCancelled:
+                self._update(job_id, state=CANCELLED)
+            except Exception as e:
+                attempts = row["attempts"] + 1
+                if attempts < self.max_attempts and not isinstance(e, (ValueError, LookupError)):
+                    delay = min(RETRY_BACKOFF_MAX_S, RETRY_BACKOFF_S * 2 ** (attempts - 1))
+                    self._update(job_id, state=QUEUED, progress=0, error=str(e), not_before=time.time() + delay)
+                else:
+                    self._update(job_id, state=FAILED, progress=0, error=str(e))
+            finally:
+                with self._lock:
+                    self._cancel_requested.discard(job_id)
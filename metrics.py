@@ -0,0 +1,191 @@
+# metrics.py – lightweight in-process instrumentation.
+# Counters, gauges and histograms with optional labels, rendered in Prometheus text format
+# for the Flask /metrics route and summarized as a short text overlay for the GUIs.
+# Recording is a lock + a couple of list updates, cheap enough for every stage of every image.
+
+import time, bisect, threading
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _fmt_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name, self.help = name, help
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, v) for key, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, help, fn=None):
+        """fn() -> number or {labels_tuple_or_dict: number}, read at scrape time."""
+        super().__init__(name, help)
+        self.fn = fn
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_labels_key(labels)] = value
+
+    def samples(self):
+        if self.fn is None:
+            return super().samples()
+        value = self.fn()
+        if isinstance(value, dict):
+            return [(self.name, _labels_key(k) if isinstance(k, dict) else tuple(k), v) for k, v in value.items()]
+        return [(self.name, (), value)]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels → [bucket counts..., sum, count, last]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * (len(self.buckets) + 3)
+            if idx < len(self.buckets):
+                s[idx] += 1
+            n = len(self.buckets)
+            s[n] += value
+            s[n + 1] += 1
+            s[n + 2] = value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def summary(self):
+        """{labels: (last, mean, count)} for overlays."""
+        n = len(self.buckets)
+        with self._lock:
+            return {key: (s[n + 2], s[n] / s[n + 1] if s[n + 1] else 0.0, s[n + 1])
+                    for key, s in self._series.items()}
+
+    def samples(self):
+        n = len(self.buckets)
+        out = []
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for key, s in series.items():
+            cumulative = 0
+            for b, c in zip(self.buckets, s[:n]):
+                cumulative += c
+                out.append((f"{self.name}_bucket", key + (("le", f"{b:g}"),), cumulative))
+            out.append((f"{self.name}_bucket", key + (("le", "+Inf"),), s[n + 1]))
+            out.append((f"{self.name}_sum", key, s[n]))
+            out.append((f"{self.name}_count", key, s[n + 1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self._add(Counter(name, help))
+
+    def gauge(self, name, help, fn=None):
+        return self._add(Gauge(name, help, fn))
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, buckets))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for m in metrics:
+            try:
+                samples = m.samples()
+            except Exception:
+                continue  # a failing gauge callback must not break the scrape
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, key, value in samples:
+                lines.append(f"{name}{_fmt_labels(key)} {value:g}" if isinstance(value, float)
+                             else f"{name}{_fmt_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("carrec_stage_seconds", "Time spent per pipeline stage")
+IMAGES_TOTAL = REGISTRY.counter("carrec_images_total", "Images run through detection")
+VEHICLES_TOTAL = REGISTRY.counter("carrec_vehicles_total", "Vehicles detected")
+REQUEST_SECONDS = REGISTRY.histogram("carrec_http_request_seconds", "HTTP request latency")
+BYTES_WRITTEN = REGISTRY.histogram("carrec_bytes_written", "Bytes written per stored file", BYTES_BUCKETS)
+
+
+def timed(stage):
+    """with timed("decode"): ...  – records into carrec_stage_seconds{stage=...}."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def record_speed(speed):
+    """One Ultralytics speed dict (ms) → preprocess / inference / nms stages."""
+    for key, stage in (("preprocess", "preprocess"), ("inference", "inference"), ("postprocess", "nms")):
+        if (speed or {}).get(key) is not None:
+            STAGE_SECONDS.observe(speed[key] / 1000.0, stage=stage)
+
+
+def record_yolo_speed(results):
+    """Feed Ultralytics' own per-image timings in as preprocess / inference / nms stages."""
+    for r in results:
+        record_speed(getattr(r, "speed", None))
+
+
+def record_detection(n_vehicles):
+    IMAGES_TOTAL.inc()
+    VEHICLES_TOTAL.inc(n_vehicles)
+
+
+def overlay_text():
+    """Short multi-line summary of stage timings (last / mean ms) for GUI overlays."""
+    rows = []
+    for key, (last, mean, count) in sorted(STAGE_SECONDS.summary().items()):
+        stage = dict(key).get("stage", "?")
+        rows.append(f"{stage:<11} {last * 1000:8.1f} ms  (avg {mean * 1000:7.1f}, n={count})")
+    return "\n".join(rows) or "no timings yet"
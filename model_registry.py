@@ -0,0 +1,71 @@
+# model_registry.py – lazy, cached YOLO model loading.
+# Nothing heavy is imported or loaded until the first get_model() call; models are cached
+# by (weights, device) so every tool in the process shares one copy. FP16 is a per-call
+# predict(half=True) option on CUDA, not a separate resident model.
+
+import threading
+
+MODEL_SIZES = {
+    "n": "yolov8n.pt",
+    "s": "yolov8s.pt",
+    "m": "yolov8m.pt",
+    "l": "yolov8l.pt",
+    "x": "yolov8x.pt",
+}
+DEFAULT_SIZE = "x"
+
+_models = {}
+_key_locks = {}
+_lock = threading.Lock()
+
+
+def resolve_weights(name=DEFAULT_SIZE):
+    """Map a size letter (n/s/m/l/x) to its weights file; anything else is used as a path."""
+    return MODEL_SIZES.get(str(name).lower(), name)
+
+
+def default_device():
+    import torch
+    return 0 if torch.cuda.is_available() else "cpu"
+
+
+def _key(weights, device):
+    return resolve_weights(weights), str(device)
+
+
+def get_model(weights=DEFAULT_SIZE, device=None):
+    """Return the cached YOLO model for this config, loading it on first use.
+
+    Concurrent callers asking for the same model wait for a single load.
+    """
+    device = default_device() if device is None else device
+    key = _key(weights, device)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock:
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        model = _models.get(key)
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(key[0])
+            if device != "cpu":
+                model.to(f"cuda:{device}" if isinstance(device, int) or str(device).isdigit() else device)
+            _models[key] = model
+    return model
+
+
+def is_loaded(weights=DEFAULT_SIZE, device=None):
+    device = default_device() if device is None else device
+    return _key(weights, device) in _models
+
+
+def loaded_models():
+    return sorted(_models)
+
+
+def unload(weights=DEFAULT_SIZE, device=None):
+    device = default_device() if device is None else device
+    _models.pop(_key(weights, device), None)
+
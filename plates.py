@@ -0,0 +1,252 @@
+# plates.py – license-plate reading on detected vehicles.
+# Only vehicle crops are searched: a cheap OpenCV pass finds plate-shaped, high-contrast
+# regions in the lower part of each crop, and those small patches go to EasyOCR in one batch.
+# Reads are cached by a hash of the patch, and in video each track is OCR'd a few times at most.
+#
+#   reader = PlateReader()
+#   boxes = reader.read(img, vehicle_boxes(result))   # adds b["plate"] = {"text", "conf"} | None
+
+import re, hashlib, threading
+from collections import OrderedDict, Counter, defaultdict
+import cv2
+import numpy as np
+
+from metrics import timed, REGISTRY
+
+OCR_LANGS = ("en",)
+OCR_BATCH = 16
+OCR_SIZE = (256, 64)          # every plate patch is resized to this for batched OCR
+PLATE_ALLOWLIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+PLATE_MIN_CHARS = 4
+PLATE_MIN_CONF = 0.3
+MIN_VEHICLE_WIDTH = 60        # smaller crops can't hold a readable plate
+MAX_CANDIDATES = 2            # plate regions tried per vehicle
+MAX_READS_PER_TRACK = 3       # video: OCR a tracked vehicle at most this many times
+CACHE_ENTRIES = 4096
+
+PLATE_READS = REGISTRY.counter("carrec_plate_reads_total", "Plate OCR lookups by outcome")
+
+
+def normalize_plate(text):
+    return re.sub(r"[^A-Z0-9]", "", (text or "").upper())
+
+
+def crop_hash(patch):
+    """Hash of a coarse grayscale thumbnail: identical or near-identical patches share a read."""
+    gray = patch if patch.ndim == 2 else cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (64, 16), interpolation=cv2.INTER_AREA) >> 3
+    return hashlib.blake2b(small.tobytes(), digest_size=16).hexdigest()
+
+
+def plate_candidates(crop, max_candidates=MAX_CANDIDATES):
+    """Likely plate regions (x0, y0, x1, y1) inside a vehicle crop, best first.
+
+    Plates are wide, high-contrast strips of dark characters on a light field (or vice versa):
+    a blackhat + horizontal-gradient pass, closed with a wide kernel, picks them out cheaply.
+    """
+    h, w = crop.shape[:2]
+    top = h // 3  # plates sit in the lower two thirds of a vehicle box
+    gray = cv2.cvtColor(crop[top:], cv2.COLOR_BGR2GRAY)
+    kw = max(9, w // 12) | 1
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (kw, kw // 3 | 1)))
+    grad = np.abs(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=3))
+    grad = cv2.normalize(grad, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    grad = cv2.GaussianBlur(grad, (5, 5), 0)
+    _, mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (kw, 3)))
+    mask = cv2.erode(mask, None, iterations=1)
+    mask = cv2.dilate(mask, None, iterations=2)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    scored = []
+    for c in contours:
+        x, y, cw, ch = cv2.boundingRect(c)
+        aspect = cw / max(ch, 1)
+        rel_w = cw / w
+        if not (2.0 <= aspect <= 7.0 and 0.12 <= rel_w <= 0.6 and ch >= 8):
+            continue
+        # Prefer centred, plate-proportioned regions with dense edges
+        fill = cv2.countNonZero(mask[y:y + ch, x:x + cw]) / float(cw * ch)
+        centred = 1.0 - abs((x + cw / 2) / w - 0.5)
+        scored.append((fill * centred * min(aspect / 4.0, 1.0), (x, y + top, x + cw, y + top + ch)))
+    scored.sort(key=lambda s: -s[0])
+    pad = lambda x0, y0, x1, y1: (max(0, x0 - 4), max(0, y0 - 3), min(w, x1 + 4), min(h, y1 + 3))
+    return [pad(*box) for _, box in scored[:max_candidates]]
+
+
+class PlateReader:
+    def __init__(self, langs=OCR_LANGS, gpu=None, batch_size=OCR_BATCH, cache_entries=CACHE_ENTRIES,
+                 min_conf=PLATE_MIN_CONF):
+        """EasyOCR is imported and its models loaded on first use (gpu=None: CUDA if available)."""
+        self.langs = list(langs)
+        self.gpu = gpu
+        self.batch_size = batch_size
+        self.min_conf = min_conf
+        self.cache_entries = cache_entries
+        self._reader = None
+        self._cache = OrderedDict()  # crop hash → (text, conf) | None
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.ocr_calls = 0
+
+    def _ocr(self):
+        with self._lock:
+            if self._reader is None:
+                try:
+                    import easyocr
+                except ImportError as e:
+                    raise RuntimeError("plate reading needs easyocr (pip install easyocr)") from e
+                gpu = self.gpu
+                if gpu is None:
+                    import torch
+                    gpu = torch.cuda.is_available()
+                self._reader = easyocr.Reader(self.langs, gpu=gpu, verbose=False)
+            return self._reader
+
+    # ----- cache -----
+    def _peek(self, key):
+        """(found, value) without touching the hit/miss counters."""
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return True, self._cache[key]
+            return False, None
+
+    def _store(self, key, value):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+
+    # ----- reading -----
+    def _read_patches(self, patches):
+        """Batched OCR of equally-sized patches → [(text, conf) | None]."""
+        reader = self._ocr()
+        out = []
+        with timed("ocr"):
+            for i in range(0, len(patches), self.batch_size):
+                chunk = patches[i:i + self.batch_size]
+                self.ocr_calls += 1
+                results = reader.readtext_batched(chunk, n_width=OCR_SIZE[0], n_height=OCR_SIZE[1],
+                                                  batch_size=len(chunk), allowlist=PLATE_ALLOWLIST,
+                                                  detail=1, paragraph=False)
+                for words in results:
+                    words = sorted(words, key=lambda w: min(p[0] for p in w[0]))  # left → right
+                    text = normalize_plate("".join(w[1] for w in words))
+                    conf = float(min((w[2] for w in words), default=0.0))
+                    ok = len(text) >= PLATE_MIN_CHARS and conf >= self.min_conf
+                    out.append((text, round(conf, 3)) if ok else None)
+        return out
+
+    def read_many(self, items):
+        """items: [(bgr_image, boxes)]; sets b["plate"] on every box and returns the box lists.
+
+        All uncached plate patches across all images go through the OCR engine together.
+        """
+        jobs = []    # (box, [patch keys])
+        todo = {}    # key → patch (deduplicated)
+        for img, boxes in items:
+            H, W = img.shape[:2]
+            for b in boxes:
+                x1, y1, x2, y2 = (int(v) for v in b["xyxy"])
+                x1, y1, x2, y2 = max(0, x1), max(0, y1), min(W, x2), min(H, y2)
+                b["plate"] = None
+                if x2 - x1 < MIN_VEHICLE_WIDTH or y2 - y1 < MIN_VEHICLE_WIDTH // 3:
+                    continue
+                crop = img[y1:y2, x1:x2]
+                with timed("plate_locate"):
+                    cands = plate_candidates(crop)
+                keyed = []
+                for cx0, cy0, cx1, cy1 in cands:
+                    patch = cv2.resize(crop[cy0:cy1, cx0:cx1], OCR_SIZE, interpolation=cv2.INTER_CUBIC)
+                    patch = cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY)
+                    key = crop_hash(patch)
+                    keyed.append(key)
+                    if key in todo:
+                        continue
+                    if self._peek(key)[0]:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                        todo[key] = patch
+                jobs.append((b, keyed))
+
+        if todo:
+            keys = list(todo)
+            for key, value in zip(keys, self._read_patches([todo[k] for k in keys])):
+                self._store(key, value)
+                PLATE_READS.inc(outcome="read" if value else "empty")
+
+        for b, keyed in jobs:
+            best = None
+            for key in keyed:
+                found, value = self._peek(key)
+                if found and value and (best is None or value[1] > best[1]):
+                    best = value
+            if keyed and best is None:
+                PLATE_READS.inc(outcome="none")
+            b["plate"] = {"text": best[0], "conf": best[1]} if best else None
+        return [boxes for _, boxes in items]
+
+    def read(self, img, boxes):
+        return self.read_many([(img, boxes)])[0]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "ocr_calls": self.ocr_calls,
+                    "cached": len(self._cache)}
+
+
+class TrackPlates:
+    """Per-track plate voting for video: each track is read at most max_reads times."""
+
+    def __init__(self, reader, max_reads=MAX_READS_PER_TRACK):
+        self.reader = reader
+        self.max_reads = max_reads
+        self._reads = Counter()                 # track id → OCR attempts
+        self._votes = defaultdict(Counter)      # track id → {text: summed conf}
+
+    def wants(self, track_id):
+        votes = self._votes.get(track_id)
+        settled = votes and votes.most_common(1)[0][1] >= 1.5  # e.g. two confident agreeing reads
+        return self._reads[track_id] < self.max_reads and not settled
+
+    def update(self, items):
+        """items: [(bgr_image, tracked boxes with "id")]; OCRs only the tracks that still need it."""
+        needed, taken = [], set()
+        for img, boxes in items:
+            # A track shows up on every frame of the batch: read it on one of them only
+            picked = [b for b in boxes if "id" in b and b["id"] not in taken and self.wants(b["id"])]
+            taken.update(b["id"] for b in picked)
+            if picked:
+                needed.append((img, picked))
+        if needed:
+            for _, boxes in needed:
+                for b in boxes:
+                    self._reads[b["id"]] += 1
+            self.reader.read_many(needed)
+            for _, boxes in needed:
+                for b in boxes:
+                    if b["plate"]:
+                        self._votes[b["id"]][b["plate"]["text"]] += b["plate"]["conf"]
+        for _, boxes in items:
+            self.annotate(boxes)
+
+    def annotate(self, boxes):
+        """Attach each track's current best plate (if any) to its box dict."""
+        for b in boxes:
+            best = self.best(b.get("id"))
+            if best:
+                b["plate"] = best
+        return boxes
+
+    def best(self, track_id):
+        votes = self._votes.get(track_id)
+        if not votes:
+            return None
+        text, score = votes.most_common(1)[0]
+        return {"text": text, "conf": round(score / max(1, self._reads[track_id]), 3)}
+
+    def plates(self):
+        """{track id: plate text} for every track with a read."""
+        return {tid: self.best(tid)["text"] for tid in self._votes if self._votes[tid]}
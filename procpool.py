@@ -0,0 +1,237 @@
+# procpool.py – multi-process CPU inference with shared-memory frame handoff.
+# One Python process can't keep a many-core CPU busy: pre/post-processing holds the GIL and
+# torch runs a single intra-op pool. Here N worker processes each load the model once with
+# their own slice of the cores. Frames are copied once into reusable shared-memory slots
+# (never pickled), and results come back through a queue, matched to Futures by sequence number.
+#
+#   with ProcessInferencePool("n", workers=8) as pool:
+#       for boxes in pool.map(frames): ...
+
+import os, queue, threading, itertools
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+import numpy as np
+
+from detection import VEHICLE_LABELS
+from metrics import record_speed
+
+THREAD_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+SLOTS_PER_WORKER = 2
+MIN_SLOT_BYTES = 1920 * 1080 * 3
+
+
+def partition_threads(workers, cores=None):
+    """Torch intra-op threads per worker so workers * threads ~= cores (at least 1)."""
+    cores = cores or os.cpu_count() or 1
+    return max(1, cores // max(1, workers))
+
+
+def _attach(name):
+    """Open a segment created by the parent. Spawned workers share the parent's resource
+    tracker, so attaching doesn't register a second owner that would unlink it early."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(worker_id, cfg, tasks, results):
+    # Thread limits must be in place before torch / cv2 spin up their pools
+    for var in THREAD_ENV:
+        os.environ[var] = str(cfg["threads"])
+    import torch, cv2
+    torch.set_num_threads(cfg["threads"])
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    cv2.setNumThreads(1)
+    import backends
+    from detection import vehicle_boxes, vehicle_class_ids
+
+    try:
+        model, device, backend = backends.load(cfg["weights"], cfg["backend"], cfg["int8"], cfg["calib_dir"],
+                                               cfg["imgsz"], device="cpu")
+        class_ids = vehicle_class_ids(model.names, cfg["labels"])
+        predict = dict(conf=cfg["conf"], iou=cfg["iou"], imgsz=cfg["imgsz"], device=device,
+                       classes=class_ids, verbose=False)
+        model.predict(np.zeros((cfg["imgsz"], cfg["imgsz"], 3), np.uint8), **predict)  # warm-up
+    except Exception as e:
+        results.put(("dead", worker_id, repr(e), None))
+        return
+    results.put(("ready", worker_id, backend, None))
+
+    attached = {}  # slot index → (segment name, SharedMemory)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        batch = [task]
+        while len(batch) < cfg["batch"]:
+            try:
+                nxt = tasks.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None:
+                tasks.put(None)  # leave the stop marker for the next loop
+                break
+            batch.append(nxt)
+
+        frames, out = [], None
+        for seq, slot, name, shape in batch:
+            if attached.get(slot, (None,))[0] != name:  # slot was regrown by the parent
+                if slot in attached:
+                    attached[slot][1].close()
+                attached[slot] = (name, _attach(name))
+            frames.append(np.ndarray(shape, np.uint8, buffer=attached[slot][1].buf))
+        try:
+            out = model.predict(frames, **predict)
+            for (seq, *_), r in zip(batch, out):
+                results.put(("ok", seq, vehicle_boxes(r, cfg["labels"]), dict(r.speed)))
+        except Exception as e:
+            for seq, *_ in batch:
+                results.put(("err", seq, repr(e), None))
+        frames = out = None  # drop buffer views so segments can be closed
+    for _, shm in attached.values():
+        shm.close()
+
+
+class ProcessInferencePool:
+    def __init__(self, weights="n", workers=None, threads=None, backend="pytorch", int8=False, calib_dir=None,
+                 labels=VEHICLE_LABELS, conf=0.20, iou=0.5, imgsz=640, batch=1, slots=None):
+        """workers defaults to cores // 4; threads to an even split of the cores across workers."""
+        self.workers = workers or max(1, (os.cpu_count() or 1) // 4)
+        threads = threads or partition_threads(self.workers)
+        self.cfg = {"weights": weights, "backend": backend, "int8": int8, "calib_dir": calib_dir,
+                    "labels": set(labels), "conf": conf, "iou": iou, "imgsz": imgsz,
+                    "batch": max(1, batch), "threads": threads}
+        ctx = mp.get_context("spawn")  # fork + torch threads is unsafe
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._procs = [ctx.Process(target=_worker_main, args=(i, self.cfg, self._tasks, self._results),
+                                   name=f"infer-{i}", daemon=True) for i in range(self.workers)]
+        n_slots = slots or self.workers * SLOTS_PER_WORKER * self.cfg["batch"]
+        self._slots = [None] * n_slots         # SharedMemory per slot, created / regrown on demand
+        self._free = queue.Queue()
+        for i in range(n_slots):
+            self._free.put(i)
+        self._pending = {}                     # seq → (Future, slot)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._error = None
+        self.backends = {}
+        self._closed = False
+        for p in self._procs:
+            p.start()
+        self._collector = threading.Thread(target=self._collect, name="infer-results", daemon=True)
+        self._collector.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def wait_ready(self, timeout=None):
+        """Block until every worker has loaded and warmed its model; raises if one failed."""
+        self._ready.wait(timeout)
+        if self._error:
+            raise RuntimeError(self._error)
+        return self._ready.is_set()
+
+    def _slot_for(self, nbytes):
+        idx = self._free.get()
+        shm = self._slots[idx]
+        if shm is None or shm.size < nbytes:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            shm = self._slots[idx] = shared_memory.SharedMemory(create=True, size=max(nbytes, MIN_SLOT_BYTES))
+        return idx, shm
+
+    def submit(self, img):
+        """Queue one BGR uint8 frame; the Future resolves to its vehicle boxes."""
+        if self._closed:
+            raise RuntimeError("pool is closed")
+        if self._error:
+            raise RuntimeError(self._error)
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        idx, shm = self._slot_for(img.nbytes)  # blocks while every slot is in flight
+        np.ndarray(img.shape, np.uint8, buffer=shm.buf)[...] = img
+        fut = Future()
+        with self._lock:
+            seq = next(self._seq)
+            self._pending[seq] = (fut, idx)
+        self._tasks.put((seq, idx, shm.name, img.shape))
+        return fut
+
+    def map(self, frames):
+        """Yield boxes for each frame in input order, keeping every slot busy."""
+        inflight = []
+        for img in frames:
+            inflight.append(self.submit(img))
+            # submit() blocks on a free slot; results are yielded as soon as the head is done
+            while inflight and inflight[0].done():
+                yield inflight.pop(0).result()
+            if len(inflight) >= len(self._slots):
+                yield inflight.pop(0).result()
+        for fut in inflight:
+            yield fut.result()
+
+    def _collect(self):
+        ready = 0
+        while True:
+            try:
+                kind, key, value, speed = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if self._closed:
+                    return
+                if any(not p.is_alive() for p in self._procs):
+                    self._fail(f"inference worker exited ({[p.exitcode for p in self._procs]})")
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+            if kind == "ready":
+                self.backends[key] = value
+                ready += 1
+                if ready == self.workers:
+                    self._ready.set()
+            elif kind == "dead":
+                self._fail(f"worker {key} failed to load the model: {value}")
+                return
+            else:
+                with self._lock:
+                    fut, idx = self._pending.pop(key)
+                self._free.put(idx)
+                if kind == "ok":
+                    record_speed(speed)
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(RuntimeError(value))
+
+    def _fail(self, message):
+        self._error = message
+        self._ready.set()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for fut, idx in pending.values():
+            fut.set_exception(RuntimeError(message))
+            self._free.put(idx)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._procs:
+            self._tasks.put(None)
+        for p in self._procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+        for shm in self._slots:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
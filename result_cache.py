@@ -0,0 +1,149 @@
+# result_cache.py – content-addressed cache for detection results.
+# Keys hash the image bytes together with every setting that changes the output (weights,
+# conf, iou, imgsz, class filter, mode). A bounded in-memory LRU sits in front of a JSON
+# store on disk that is evicted oldest-first once it grows past its byte budget.
+
+import os, json, hashlib, threading, tempfile
+from collections import OrderedDict
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "detections")
+MAX_MEMORY_ENTRIES = 1024
+MAX_DISK_BYTES = 256 * 1024 * 1024
+
+
+def bytes_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def weights_id(weights):
+    """Identity of a weights file for cache keys: absolute path, size and mtime for a local file
+    (so runs/a/best.pt and runs/b/best.pt, or a retrained best.pt, never share results), else the name."""
+    try:
+        st = os.stat(weights)
+    except (OSError, TypeError, ValueError):
+        return str(weights)  # stock name the loader downloads, e.g. yolov8x.pt
+    return f"{os.path.abspath(weights)}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def cache_key(image_digest, weights, conf, iou, imgsz, labels, **extra):
+    """Combine an image digest with the detection settings into one stable key."""
+    params = {"weights": weights_id(weights), "conf": conf, "iou": iou, "imgsz": imgsz,
+              "labels": sorted(l.lower() for l in labels), **extra}
+    blob = json.dumps(params, sort_keys=True).encode()
+    return hashlib.sha256(image_digest.encode() + b"|" + blob).hexdigest()
+
+
+class DetectionCache:
+    def __init__(self, directory=CACHE_DIR, max_entries=MAX_MEMORY_ENTRIES, max_disk_bytes=MAX_DISK_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._mem = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = 0
+        self._disk_bytes = None  # computed on first write
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """Cached boxes for key, or None."""
+        with self._lock:
+            if key in self._mem:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return self._mem[key]
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                boxes = json.load(f)
+            os.utime(path)  # recency for disk eviction
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, boxes)
+        return boxes
+
+    def put(self, key, boxes):
+        with self._lock:
+            self._remember(key, boxes)
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(boxes, f)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp, path)
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._disk_bytes += os.path.getsize(path) - old
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _remember(self, key, boxes):
+        self._mem[key] = boxes
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _scan(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    p = os.path.join(root, name)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    yield p, st.st_size, st.st_mtime
+
+    def _evict_disk(self):
+        """Drop least recently used files until the store is back under 90% of its budget."""
+        entries = sorted(self._scan(), key=lambda e: e[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * 0.9
+        for p, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            for p, _, _ in list(self._scan()):
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+            self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._mem),
+                "disk_bytes": self._disk_bytes,
+            }
@@ -0,0 +1,112 @@
+# scheduler.py – micro-batching inference scheduler.
+# One thread owns the model; callers submit frames and get a Future back. Concurrent
+# submissions are coalesced into a single predict call, bounded by max_batch and max_wait_ms.
+
+import time, queue, threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from detection import VEHICLE_LABELS, vehicle_boxes, vehicle_class_ids
+from metrics import REGISTRY, record_yolo_speed, record_detection
+
+BATCH_SIZE = REGISTRY.histogram("carrec_scheduler_batch_size", "Frames per coalesced predict call",
+                                (1, 2, 4, 8, 16, 32, 64))
+
+
+class BatchScheduler:
+    def __init__(self, load_model, max_batch=8, max_wait_ms=10, labels=VEHICLE_LABELS,
+                 conf=0.20, iou=0.5, imgsz=1280, device=None):
+        """load_model() is called once, on the scheduler thread, before the first batch."""
+        self._load_model = load_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.labels = labels
+        self.predict_kwargs = {"conf": conf, "iou": iou, "imgsz": imgsz, "device": device, "verbose": False}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.frames = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join()
+
+    def submit(self, img):
+        """Queue a BGR ndarray; the Future resolves to its list of vehicle boxes."""
+        fut = Future()
+        self.start()
+        self._queue.put((img, fut))
+        return fut
+
+    def detect(self, img, timeout=None):
+        fut = self.submit(img)
+        try:
+            return fut.result(timeout)
+        except FutureTimeout:
+            fut.cancel()  # still queued: the frame is dropped instead of inferred for nobody
+            raise
+
+    @property
+    def avg_batch(self):
+        return self.frames / self.batches if self.batches else 0.0
+
+    def _collect(self, first):
+        """Gather up to max_batch jobs, waiting at most max_wait after the first one arrived."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:  # stop requested; finish this batch first
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        model = class_ids = None
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = []
+            try:
+                batch = [job for job in self._collect(first) if job[1].set_running_or_notify_cancel()]
+                if not batch:
+                    continue
+                if model is None:
+                    model = self._load_model()
+                    class_ids = vehicle_class_ids(model.names, self.labels)
+                results = model.predict([img for img, _ in batch], classes=class_ids, **self.predict_kwargs)
+                self.batches += 1
+                self.frames += len(batch)
+                BATCH_SIZE.observe(len(batch))
+                record_yolo_speed(results)
+            except Exception as e:
+                self._fail(batch, e)
+                continue
+            for (_, fut), r in zip(batch, results):
+                # Each frame resolves on its own, so one bad result can't touch the others
+                try:
+                    boxes = vehicle_boxes(r, self.labels)
+                    record_detection(len(boxes))
+                    fut.set_result(boxes)
+                except Exception as e:
+                    self._fail([(None, fut)], e)
+
+    @staticmethod
+    def _fail(batch, error):
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_exception(error)
@@ -0,0 +1,168 @@
+# thumbnails.py – gallery thumbnails decoded off the Tk thread and cached on disk.
+# Keys combine the absolute path with mtime, size and thumbnail size, so an edited file gets
+# a fresh thumbnail. JPEGs are decoded in draft mode (the decoder scales by 1/2..1/8 inside
+# the DCT), which is several times faster and smaller than a full decode + resize.
+
+import os, hashlib, threading, tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+from metrics import timed
+
+THUMB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "thumbs")
+THUMB_SIZE = (220, 220)
+THUMB_WORKERS = max(2, min(8, (os.cpu_count() or 2)))
+MAX_MEMORY_THUMBS = 256
+MAX_DISK_BYTES = 128 * 1024 * 1024
+
+
+def thumb_key(path, size=THUMB_SIZE):
+    st = os.stat(path)
+    ident = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{size[0]}x{size[1]}"
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    """RGB PIL image fitting inside size, using reduced JPEG decoding when possible."""
+    with Image.open(path) as im:
+        if im.format == "JPEG":
+            im.draft("RGB", size)  # decode at the smallest 1/n scale still >= size
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail(size)
+        return im.convert("RGB")
+
+
+class ThumbnailCache:
+    def __init__(self, directory=THUMB_DIR, size=THUMB_SIZE, workers=THUMB_WORKERS,
+                 max_memory=MAX_MEMORY_THUMBS, max_disk_bytes=MAX_DISK_BYTES):
+        self.directory = directory
+        self.size = tuple(size)
+        self.max_memory = max_memory
+        self.max_disk_bytes = max_disk_bytes
+        self._mem = OrderedDict()     # path → (key, PIL image)
+        self._pending = {}            # path → [callbacks]
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumb")
+        self._writes = 0
+        self.hits = self.disk_hits = self.decodes = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.jpg")
+
+    def cached(self, path):
+        """Thumbnail from memory if present (no I/O besides stat), else None."""
+        with self._lock:
+            entry = self._mem.get(path)
+        if entry is None:
+            return None
+        try:
+            if entry[0] != thumb_key(path, self.size):
+                return None
+        except OSError:
+            return None
+        with self._lock:
+            self._mem.move_to_end(path)
+            self.hits += 1
+        return entry[1]
+
+    def request(self, path, callback):
+        """Deliver callback(path, image_or_None) from a worker thread; duplicate requests coalesce."""
+        img = self.cached(path)
+        if img is not None:
+            callback(path, img)
+            return
+        with self._lock:
+            if path in self._pending:
+                self._pending[path].append(callback)
+                return
+            self._pending[path] = [callback]
+        self._pool.submit(self._load, path)
+
+    def get(self, path):
+        """Blocking load (memory → disk → decode)."""
+        return self.cached(path) or self._load(path)
+
+    def _load(self, path):
+        img = None
+        try:
+            key = thumb_key(path, self.size)
+            disk = self._path(key)
+            if os.path.exists(disk):
+                with Image.open(disk) as im:
+                    img = im.convert("RGB")
+                with self._lock:
+                    self.disk_hits += 1
+            else:
+                with timed("thumbnail"):
+                    img = make_thumbnail(path, self.size)
+                with self._lock:
+                    self.decodes += 1
+                self._store(disk, img)
+            with self._lock:
+                self._mem[path] = (key, img)
+                self._mem.move_to_end(path)
+                while len(self._mem) > self.max_memory:
+                    self._mem.popitem(last=False)
+        except Exception:
+            img = None  # unreadable / vanished file
+        with self._lock:
+            callbacks = self._pending.pop(path, [])
+        for cb in callbacks:
+            try:
+                cb(path, img)
+            except Exception as e:
+                print("Thumbnail callback error:", e)
+        return img
+
+    def _store(self, disk, img):
+        os.makedirs(os.path.dirname(disk), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(disk), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, "JPEG", quality=85)
+            os.replace(tmp, disk)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+        with self._lock:
+            self._writes += 1
+            check = self._writes % 200 == 0
+        if check:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """Drop the oldest thumbnails once the directory outgrows its budget."""
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        total = sum(s for _, s, _ in files)
+        if total <= self.max_disk_bytes:
+            return
+        for _, s, p in sorted(files):
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= s
+            if total <= self.max_disk_bytes * 0.9:
+                break
+
+    def forget(self, paths=None):
+        """Drop in-memory thumbnails (all, or for the given paths); disk entries stay."""
+        with self._lock:
+            if paths is None:
+                self._mem.clear()
+            else:
+                for p in paths:
+                    self._mem.pop(p, None)
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,136 @@
+# tiling.py – sliced inference for large lot panoramas.
+# The image is cut into overlapping tiles at the model's native size, all tiles run as one
+# batch, and boxes are shifted back to full-image coordinates and merged across tiles.
+
+import numpy as np
+
+from detection import VEHICLE_LABELS, vehicle_class_ids, result_array, boxes_to_dicts
+from metrics import timed, record_yolo_speed
+
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+EDGE_MARGIN = 2  # px: a box this close to an inner tile border was cut by it
+
+
+def make_tiles(height, width, tile=TILE_SIZE, overlap=TILE_OVERLAP):
+    """Return (x0, y0, x1, y1) windows covering the image; edge tiles are shifted inwards."""
+    stride = max(1, int(tile * (1 - overlap)))
+
+    def starts(size):
+        if size <= tile:
+            return [0]
+        s = list(range(0, size - tile, stride))
+        s.append(size - tile)
+        return s
+
+    return [(x, y, min(x + tile, width), min(y + tile, height))
+            for y in starts(height) for x in starts(width)]
+
+
+def pairwise_iou(a, b, metric="iou"):
+    """Full IoU / IoS matrix between two (N, 4) and (M, 4) xyxy arrays."""
+    xx1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    yy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    xx2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    yy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+    area_a = ((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1]))[:, None]
+    area_b = ((b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1]))[None, :]
+    denom = np.minimum(area_a, area_b) if metric == "ios" else area_a + area_b - inter
+    return inter / np.maximum(denom, 1e-9)
+
+
+def _clusters(xyxy, scores, cls, thr, metric, cut=None):
+    """Greedy clustering by descending score; returns (keep_idx, member indices per kept box).
+
+    cut (bool per box) marks boxes clipped by a tile border: pairs involving one are compared
+    by intersection-over-smaller, so a clipped fragment folds into its whole twin, while two
+    whole boxes still need real IoU overlap (dense, overlapping cars survive).
+    """
+    order = np.argsort(-scores)
+    xyxy, cls = xyxy[order], cls[order]
+    # Offset boxes per class so different classes never overlap (class-aware merging)
+    shifted = xyxy + (cls[:, None] * (xyxy.max() + 1))
+    overlap = pairwise_iou(shifted, shifted, metric) >= thr
+    if cut is not None:
+        cut = cut[order]
+        overlap |= (pairwise_iou(shifted, shifted, "ios") >= thr) & (cut[:, None] | cut[None, :])
+    np.fill_diagonal(overlap, True)  # degenerate boxes still own themselves
+    alive = np.ones(len(order), bool)
+    keep, members = [], []
+    for i in range(len(order)):
+        if not alive[i]:
+            continue
+        group = overlap[i] & alive
+        alive &= ~group
+        keep.append(order[i])
+        members.append(order[group])
+    return np.asarray(keep, int), members
+
+
+def nms(xyxy, scores, cls, iou_thr=0.5, metric="iou", cut=None):
+    """Class-aware NMS; returns indices of kept boxes, highest score first."""
+    if len(xyxy) == 0:
+        return np.zeros(0, int)
+    keep, _ = _clusters(xyxy, scores, cls, iou_thr, metric, cut)
+    return keep
+
+
+def wbf(xyxy, scores, cls, iou_thr=0.55, metric="iou", cut=None):
+    """Weighted box fusion: each cluster collapses into its score-weighted mean box."""
+    if len(xyxy) == 0:
+        return xyxy, scores, cls
+    keep, members = _clusters(xyxy, scores, cls, iou_thr, metric, cut)
+    fused = np.empty((len(keep), 4), np.float32)
+    fused_scores = np.empty(len(keep), np.float32)
+    for k, idx in enumerate(members):
+        w = scores[idx]
+        fused[k] = (xyxy[idx] * w[:, None]).sum(0) / w.sum()
+        fused_scores[k] = w.mean()
+    return fused, fused_scores, cls[keep]
+
+
+def tiled_predict(model, img, tile=TILE_SIZE, overlap=TILE_OVERLAP, labels=VEHICLE_LABELS,
+                  conf=0.20, iou=0.5, merge="nms", merge_iou=0.5, include_full=True, device=None):
+    """Detect vehicles on overlapping tiles of a BGR image, merged into full-image boxes.
+
+    With include_full the downscaled whole frame rides along in the same batch so cars larger
+    than a tile are still found whole.
+    """
+    h, w = img.shape[:2]
+    windows = make_tiles(h, w, tile, overlap)
+    crops = [img[y0:y1, x0:x1] for x0, y0, x1, y1 in windows]
+    if include_full and len(windows) > 1:
+        crops.append(img)
+        windows.append((0, 0, w, h))
+    class_ids = vehicle_class_ids(model.names, labels)
+    results = model.predict(crops, conf=conf, iou=iou, imgsz=tile, classes=class_ids,
+                            device=device, verbose=False)
+    record_yolo_speed(results)
+
+    parts, cuts = [], []
+    for (x0, y0, x1, y1), r in zip(windows, results):
+        data = result_array(r)  # x1, y1, x2, y2, conf, cls
+        if not len(data):
+            continue
+        data[:, [0, 2]] += x0
+        data[:, [1, 3]] += y0
+        parts.append(data)
+        # Touching a tile border that isn't also the image border means the box was cut
+        cuts.append(((x0 > 0) & (data[:, 0] <= x0 + EDGE_MARGIN)) | ((y0 > 0) & (data[:, 1] <= y0 + EDGE_MARGIN))
+                    | ((x1 < w) & (data[:, 2] >= x1 - EDGE_MARGIN)) | ((y1 < h) & (data[:, 3] >= y1 - EDGE_MARGIN)))
+    if not parts:
+        return []
+    data = np.concatenate(parts)
+    cut = np.concatenate(cuts)
+    xyxy, scores, cls = data[:, :4], data[:, 4], data[:, 5].astype(int)
+
+    with timed("tile_merge"):
+        if merge == "wbf":
+            xyxy, scores, cls = wbf(xyxy, scores, cls, merge_iou, cut=cut)
+        else:
+            keep = nms(xyxy, scores, cls, merge_iou, cut=cut)
+            xyxy, scores, cls = xyxy[keep], scores[keep], cls[keep]
+
+    merged = np.column_stack([np.clip(xyxy, 0, [w, h, w, h]), scores, cls])
+    return boxes_to_dicts(merged, model.names)
@@ -0,0 +1,35 @@
+# tk_dispatch.py – run callbacks from worker threads on the Tk main thread.
+# Workers push calls into a queue; the Tk loop drains it every few milliseconds.
+
+import queue
+
+
+class TkDispatcher:
+    def __init__(self, widget, interval_ms=30):
+        self.widget = widget
+        self.interval_ms = interval_ms
+        self._queue = queue.Queue()
+        self.widget.after(self.interval_ms, self._drain)
+
+    def call(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) on the Tk thread; safe from any thread."""
+        self._queue.put((fn, args, kwargs))
+
+    def wrap(self, fn):
+        """Return a thread-safe version of fn that always runs on the Tk thread."""
+        return lambda *args, **kwargs: self.call(fn, *args, **kwargs)
+
+    def _drain(self):
+        try:
+            while True:
+                fn, args, kwargs = self._queue.get_nowait()
+                try:
+                    fn(*args, **kwargs)
+                except Exception as e:
+                    print("UI callback error:", e)
+        except queue.Empty:
+            pass
+        try:
+            self.widget.after(self.interval_ms, self._drain)
+        except Exception:
+            pass  # widget destroyed
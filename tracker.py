@@ -0,0 +1,92 @@
+# tracker.py – lightweight IoU tracker for video detection.
+# Detections on sampled frames are matched greedily to existing tracks by IoU; in between,
+# tracks are extrapolated with a constant-velocity guess so skipped frames still get boxes.
+
+import numpy as np
+
+from tiling import pairwise_iou
+
+
+class Track:
+    def __init__(self, track_id, box, frame_idx):
+        self.id = track_id
+        self.xyxy = np.asarray(box["xyxy"], np.float32)
+        self.label = box["label"]
+        self.conf = box["conf"]
+        self.velocity = np.zeros(4, np.float32)  # per frame
+        self.last_frame = frame_idx
+        self.hits = 1
+        self.misses = 0
+
+    def at(self, frame_idx):
+        """Box extrapolated to frame_idx."""
+        return self.xyxy + self.velocity * (frame_idx - self.last_frame)
+
+    def to_dict(self, frame_idx=None):
+        box = self.xyxy if frame_idx is None else self.at(frame_idx)
+        return {"id": self.id, "label": self.label, "conf": self.conf,
+                "xyxy": [int(v) for v in box]}
+
+
+class IoUTracker:
+    def __init__(self, iou_thr=0.3, max_age=5, min_hits=2):
+        """max_age counts detection rounds a track may go unmatched; min_hits confirms a track."""
+        self.iou_thr = iou_thr
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.tracks = []
+        self._next_id = 1
+        self.confirmed_ids = set()
+
+    @property
+    def unique_count(self):
+        return len(self.confirmed_ids)
+
+    def update(self, boxes, frame_idx):
+        """Feed detections of one frame; returns the confirmed tracks seen on it."""
+        dets = np.array([b["xyxy"] for b in boxes], np.float32).reshape(-1, 4)
+        matched_t, matched_d = set(), set()
+        if self.tracks and len(dets):
+            predicted = np.stack([t.at(frame_idx) for t in self.tracks])
+            iou = pairwise_iou(predicted, dets)
+            # Greedy assignment, best overlaps first
+            for ti, di in zip(*np.unravel_index(np.argsort(-iou, axis=None), iou.shape)):
+                if iou[ti, di] < self.iou_thr:
+                    break
+                if ti in matched_t or di in matched_d:
+                    continue
+                matched_t.add(ti)
+                matched_d.add(di)
+                t = self.tracks[ti]
+                gap = max(frame_idx - t.last_frame, 1)
+                t.velocity = (dets[di] - t.xyxy) / gap
+                t.xyxy = dets[di]
+                t.conf = boxes[di]["conf"]
+                t.last_frame = frame_idx
+                t.hits += 1
+                t.misses = 0
+
+        alive = []
+        for i, t in enumerate(self.tracks):
+            if i not in matched_t:
+                t.misses += 1
+            if t.misses <= self.max_age:
+                alive.append(t)
+        for di in range(len(dets)):
+            if di not in matched_d:
+                alive.append(Track(self._next_id, boxes[di], frame_idx))
+                self._next_id += 1
+        self.tracks = alive
+
+        seen = []
+        for t in self.tracks:
+            if t.hits >= self.min_hits:
+                self.confirmed_ids.add(t.id)
+            if t.last_frame == frame_idx and t.hits >= self.min_hits:
+                seen.append(t.to_dict())
+        return seen
+
+    def predict(self, frame_idx):
+        """Extrapolated boxes of confirmed, recently matched tracks for a frame without detection."""
+        return [t.to_dict(frame_idx) for t in self.tracks
+                if t.hits >= self.min_hits and t.misses == 0]
@@ -0,0 +1,133 @@
+# upload_client.py – concurrent, pooled, resumable bulk uploader for the GUI clients.
+# One pooled requests.Session is shared by a bounded thread pool. Before sending a file the
+# engine asks the server whether it already has those bytes (GET <upload_url>/<sha256>), so
+# an interrupted batch resumes where it stopped. Failed sends retry with exponential backoff.
+
+import os, time, random, hashlib, mimetypes, threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def file_sha256(path, chunk=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class UploadEngine:
+    def __init__(self, upload_url, workers=4, retries=3, backoff=0.5, timeout=20, resume=True):
+        self.upload_url = upload_url.rstrip("/")
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.resume = resume
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def upload(self, paths, on_progress=None, on_done=None):
+        """Upload all paths concurrently; blocks and returns one result dict per path.
+
+        on_progress(path, state, done_count, total) fires on every state change
+        ("checking", "uploading", "retrying", "uploaded", "skipped", "failed");
+        on_done(results) fires once at the end. Wrap both with TkDispatcher.wrap in GUIs.
+        """
+        self._cancel.clear()
+        paths = list(paths)
+        total = len(paths)
+        done = [0]
+        lock = threading.Lock()
+
+        def progress(path, state, final=False):
+            if final:
+                with lock:
+                    done[0] += 1
+            if on_progress:
+                on_progress(path, state, done[0], total)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = list(pool.map(lambda p: self._upload_one(p, progress), paths))
+        if on_done:
+            on_done(results)
+        return results
+
+    def _upload_one(self, path, progress):
+        name = os.path.basename(path)
+        result = {"path": path, "name": name, "ok": False, "skipped": False, "url": None, "error": None}
+        if self._cancel.is_set():
+            result["error"] = "cancelled"
+            progress(path, "failed", final=True)
+            return result
+        try:
+            digest = file_sha256(path)
+            if self.resume:
+                progress(path, "checking")
+                existing = self._existing(digest)
+                if existing:
+                    result.update(ok=True, skipped=True, url=existing)
+                    progress(path, "skipped", final=True)
+                    return result
+            mime = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            for attempt in range(self.retries + 1):
+                progress(path, "uploading" if attempt == 0 else "retrying")
+                try:
+                    with open(path, "rb") as f:
+                        r = self.session.post(self.upload_url, files={"file": (name, f, mime)},
+                                              timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    result["error"] = str(e)
+                else:
+                    if r.status_code not in RETRY_STATUS:
+                        break
+                    result["error"] = f"HTTP {r.status_code}"
+                if attempt < self.retries and not self._cancel.is_set():
+                    time.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+            else:
+                progress(path, "failed", final=True)
+                return result
+            data = r.json() if r.headers.get("Content-Type", "").startswith("application/json") else {}
+            if r.ok and isinstance(data, dict) and data.get("url"):
+                result.update(ok=True, url=data["url"], error=None, skipped=bool(data.get("duplicate")))
+                progress(path, "uploaded", final=True)
+            else:
+                result["error"] = (data or {}).get("error") or f"HTTP {r.status_code}"
+                progress(path, "failed", final=True)
+        except Exception as e:
+            result["error"] = str(e)
+            progress(path, "failed", final=True)
+        return result
+
+    def _existing(self, digest):
+        """URL of the already-stored copy, or None (also None if the server can't tell)."""
+        try:
+            r = self.session.get(f"{self.upload_url}/{digest}", timeout=self.timeout)
+            if r.status_code == 200:
+                return r.json().get("url")
+        except (requests.RequestException, ValueError):
+            pass
+        return None
+
+    def close(self):
+        self.session.close()
+
+
+def summarize(results):
+    """Status-line summary shared by the GUIs."""
+    ok = [r for r in results if r["ok"]]
+    skipped = sum(1 for r in ok if r["skipped"])
+    fail = [r["name"] for r in results if not r["ok"]]
+    msg = f"Uploaded {len(ok) - skipped}, already on server {skipped}"
+    if fail:
+        msg += f", failed {len(fail)}: {', '.join(fail[:3])}{'...' if len(fail) > 3 else ''}"
+    return msg
@@ -0,0 +1,150 @@
+# upload_store.py – streaming, content-addressed storage for uploaded images.
+# Upload bodies are streamed straight into a temp file next to the store while being hashed
+# and sniffed, then moved to uploads/<ab>/<cd>/<sha256>.<ext>. Identical bytes map to the same
+# path, so duplicates cost nothing and the digest doubles as a stable cache key.
+
+import os, hashlib, tempfile
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+TMP_SUBDIR = ".tmp"
+SNIFF_BYTES = 12
+
+
+def sniff_ext(head):
+    """Image type from magic bytes ('png', 'jpg', 'webp'), or None."""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def shard_path(digest, ext):
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def find_by_digest(root, digest):
+    """Relative path of a stored file with this sha256, or None."""
+    shard = os.path.join(root, digest[:2], digest[2:4])
+    try:
+        for name in os.listdir(shard):
+            if name.split(".", 1)[0] == digest:
+                return f"{digest[:2]}/{digest[2:4]}/{name}"
+    except FileNotFoundError:
+        pass
+    return None
+
+
+class HashingTempFile:
+    """Writable temp file that hashes, sniffs and size-checks bytes as they arrive.
+
+    Unless commit() moved it into the store, the temp file is deleted on close.
+    """
+
+    def __init__(self, root, max_bytes=MAX_UPLOAD_BYTES):
+        tmp_dir = os.path.join(root, TMP_SUBDIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.name = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self._f = os.fdopen(fd, "w+b")
+        self._hash = hashlib.sha256()
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b""
+        self.ext = None
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge()
+        if len(self.head) < SNIFF_BYTES:
+            self.head += bytes(data[:SNIFF_BYTES - len(self.head)])
+            if len(self.head) >= SNIFF_BYTES:
+                self.ext = sniff_ext(self.head)
+                if self.ext is None:
+                    self.close()
+                    raise UnsupportedMediaType("not a PNG, JPEG or WebP image")
+        self._hash.update(data)
+        return self._f.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+        if not self.committed:
+            try:
+                os.remove(self.name)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):  # read/seek/readline/etc. go to the real file
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def commit(tmp, root):
+    """Move a finished HashingTempFile into the store.
+
+    Returns (relative_path, digest, created); created is False for a duplicate.
+    """
+    ext = tmp.ext or sniff_ext(tmp.head)
+    if ext is None:
+        raise ValueError("not a PNG, JPEG or WebP image")
+    digest = tmp.hexdigest()
+    existing = find_by_digest(root, digest)
+    if existing:
+        tmp.close()
+        return existing, digest, False
+    rel = shard_path(digest, ext)
+    dest = os.path.join(root, *rel.split("/"))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp._f.close()
+    os.replace(tmp.name, dest)
+    tmp.committed = True
+    return rel, digest, True
+
+
+def store_chunks(chunks, root, max_bytes=MAX_UPLOAD_BYTES):
+    """Stream an iterable of byte chunks (e.g. a download) into the store."""
+    with HashingTempFile(root, max_bytes) as tmp:
+        for chunk in chunks:
+            if chunk:
+                tmp.write(chunk)
+        return commit(tmp, root)
+
+
+def store_upload(file_storage, root, max_bytes=MAX_UPLOAD_BYTES):
+    """Store a werkzeug FileStorage; zero-copy when it was parsed by StreamingUploadRequest."""
+    stream = file_storage.stream
+    if isinstance(stream, HashingTempFile):
+        return commit(stream, root)
+    stream.seek(0)
+    return store_chunks(iter(lambda: stream.read(1 << 16), b""), root, max_bytes)
+
+
+def streaming_request_class(root, allowed, max_bytes=MAX_UPLOAD_BYTES):
+    """Flask Request subclass that parses multipart files into HashingTempFiles under root.
+
+    Oversized bodies and disallowed extensions are rejected before any bytes hit the disk.
+    """
+
+    class StreamingUploadRequest(Request):
+        def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+            ext = (filename or "").rsplit(".", 1)[-1].lower()
+            if filename and ext not in allowed:
+                raise UnsupportedMediaType("unsupported type")
+            return HashingTempFile(root, max_bytes)
+
+    return StreamingUploadRequest
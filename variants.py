@@ -0,0 +1,162 @@
+# variants.py – resized / re-encoded copies of stored uploads, generated once on demand.
+# /uploads/<file>?w=200&fmt=webp&q=80 renders a variant the first time it is asked for and
+# serves it from cache/variants afterwards. Widths snap up to a fixed ladder so a handful of
+# sizes cover every client, and the directory is evicted oldest-first past its byte budget.
+
+import os, hashlib, threading, tempfile
+from PIL import Image, ImageOps
+
+from metrics import timed, BYTES_WRITTEN
+
+VARIANT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "variants")
+MAX_DISK_BYTES = 512 * 1024 * 1024
+WIDTHS = (64, 128, 200, 320, 480, 640, 850, 1024, 1280, 1600, 1920)
+FORMATS = {  # name → (PIL format, extension, mimetype)
+    "jpg": ("JPEG", "jpg", "image/jpeg"),
+    "webp": ("WEBP", "webp", "image/webp"),
+    "png": ("PNG", "png", "image/png"),
+}
+FORMAT_ALIASES = {"jpeg": "jpg"}
+DEFAULT_QUALITY = 82
+VARIANT_PARAMS = ("w", "fmt", "q")  # any other query arg (e.g. a ?v= cache-buster) serves the original
+
+
+def snap_width(width):
+    """Smallest ladder width >= width (the largest one for anything bigger)."""
+    for w in WIDTHS:
+        if w >= width:
+            return w
+    return WIDTHS[-1]
+
+
+def _int_arg(args, name):
+    raw = args.get(name)
+    if raw is None or raw == "":
+        return None
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer") from None
+
+
+def parse_params(args, src_ext):
+    """(width, fmt, quality) from query args; raises ValueError on bad input."""
+    width = _int_arg(args, "w")
+    if width is not None and width <= 0:
+        raise ValueError("w must be positive")
+    fmt = (args.get("fmt") or src_ext).lower()
+    fmt = FORMAT_ALIASES.get(fmt, fmt)
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(FORMATS)}")
+    quality = _int_arg(args, "q")
+    quality = DEFAULT_QUALITY if quality is None else quality
+    if not 30 <= quality <= 95:
+        raise ValueError("q must be between 30 and 95")
+    return (snap_width(width) if width else None), fmt, quality
+
+
+def render(src, dst, width, fmt, quality):
+    """Write a variant of src to dst atomically; never upscales."""
+    pil_format = FORMATS[fmt][0]
+    with Image.open(src) as im:
+        if width and im.format == "JPEG":
+            im.draft("RGB", (width, width * 4))
+        im = ImageOps.exif_transpose(im)
+        if width and im.width > width:
+            im = im.resize((width, max(1, round(im.height * width / im.width))), Image.LANCZOS)
+        if pil_format == "JPEG" and im.mode != "RGB":
+            im = im.convert("RGB")
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dst), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                options = {"optimize": True} if pil_format == "PNG" else {"quality": quality}
+                im.save(f, pil_format, **options)
+            os.replace(tmp, dst)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+class VariantStore:
+    def __init__(self, directory=VARIANT_DIR, max_disk_bytes=MAX_DISK_BYTES):
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._disk_bytes = None  # computed on first write
+        self.hits = self.renders = 0
+
+    def key(self, src, width, fmt, quality):
+        """Variant id: source identity (path, mtime, size) plus the render parameters."""
+        st = os.stat(src)
+        ident = f"{os.path.abspath(src)}|{st.st_mtime_ns}|{st.st_size}|{width}|{fmt}|{quality}"
+        return hashlib.sha256(ident.encode("utf-8")).hexdigest()
+
+    def _path(self, key, fmt):
+        return os.path.join(self.directory, key[:2], f"{key}.{FORMATS[fmt][1]}")
+
+    def get(self, src, width, fmt, quality=DEFAULT_QUALITY):
+        """Path to the cached variant, rendering it first if needed (once per key)."""
+        key = self.key(src, width, fmt, quality)
+        dst = self._path(key, fmt)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if os.path.exists(dst):
+                os.utime(dst)  # recency for eviction
+                with self._lock:
+                    self.hits += 1
+            else:
+                with timed("variant"):
+                    render(src, dst, width, fmt, quality)
+                size = os.path.getsize(dst)
+                BYTES_WRITTEN.observe(size, kind="variant")
+                with self._lock:
+                    self.renders += 1
+                self._account(size)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return dst, key
+
+    def _scan(self):
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    st = os.stat(p)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, p))
+        return files
+
+    def _account(self, size):
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(s for _, s, _ in self._scan())
+            else:
+                self._disk_bytes += size
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently served variants down to 90% of the budget."""
+        files = sorted(self._scan())
+        total = sum(s for _, s, _ in files)
+        for _, s, p in files:
+            if total <= self.max_disk_bytes * 0.9:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                continue
+            total -= s
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "renders": self.renders, "disk_bytes": self._disk_bytes}
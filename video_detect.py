@@ -0,0 +1,276 @@
+# video_detect.py – vehicle detection on video files, RTSP streams and camera devices.
+# Three stages joined by bounded queues: a reader thread decodes frames, the main thread
+# batches every `stride`-th frame through YOLO and tracks vehicles in between, and a writer
+# thread draws and encodes the output. Live sources drop frames instead of falling behind.
+#
+#   python video_detect.py car_example.mp4 --out car_detected.mp4 --stride 2
+#   python video_detect.py rtsp://camera/stream --weights n --imgsz 640
+#   python video_detect.py 0               # first webcam
+
+import json, time, queue, argparse, threading
+import cv2
+
+from detection import VEHICLE_LABELS, vehicle_boxes, vehicle_class_ids, BOX_COLOR
+from model_registry import default_device, MODEL_SIZES
+import backends
+from tracker import IoUTracker
+from metrics import timed, record_yolo_speed
+from plates import PlateReader, TrackPlates
+from detection_index import DetectionIndex, INDEX_DB
+
+_EOS = object()  # end-of-stream marker passed down the queues
+
+
+def open_source(source):
+    """cv2.VideoCapture for a file path, URL (rtsp/http) or device index ("0")."""
+    src = int(source) if str(source).isdigit() else source
+    cap = cv2.VideoCapture(src)
+    if not cap.isOpened():
+        raise IOError(f"cannot open video source: {source}")
+    return cap
+
+
+def is_live(source):
+    s = str(source)
+    return s.isdigit() or s.startswith(("rtsp://", "rtmp://", "http://", "https://"))
+
+
+class VideoStats:
+    def __init__(self):
+        self.read = self.dropped = self.detected = self.written = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def as_dict(self, tracker=None):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        out = {
+            "frames_read": self.read,
+            "frames_dropped": self.dropped,
+            "frames_detected": self.detected,
+            "frames_written": self.written,
+            "seconds": round(elapsed, 3),
+            "fps": round(self.written / elapsed, 2) if elapsed else 0.0,
+        }
+        if tracker is not None:
+            out["unique_vehicles"] = tracker.unique_count
+        return out
+
+
+def _reader(cap, frames_q, stats, drop_when_full, stop):
+    idx = 0
+    while not stop.is_set():
+        ok, frame = cap.read()
+        if not ok:
+            break
+        stats.read += 1
+        if drop_when_full:
+            try:
+                frames_q.put_nowait((idx, frame))
+            except queue.Full:
+                stats.dropped += 1  # live source: never let latency build up
+        else:
+            frames_q.put((idx, frame))
+        idx += 1
+    cap.release()
+    frames_q.put(_EOS)
+
+
+def _draw(frame, tracks, count=None):
+    for t in tracks:
+        x1, y1, x2, y2 = t["xyxy"]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        tag = f"#{t['id']}" if "id" in t else t["label"]
+        if t.get("plate"):
+            tag += f" {t['plate']['text']}"
+        cv2.putText(frame, tag, (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX, 0.6, BOX_COLOR, 2)
+    if count is not None:
+        cv2.putText(frame, f"vehicles: {count}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.9, BOX_COLOR, 2)
+    return frame
+
+
+def _writer(out_q, writer_factory, stats, on_frame, stop, errors):
+    writer = None
+    try:
+        while True:
+            item = out_q.get()
+            if item is _EOS:
+                break
+            idx, frame, tracks, count = item
+            _draw(frame, tracks, count)
+            if writer is None and writer_factory:
+                writer = writer_factory(frame)
+            if writer is not None:
+                writer.write(frame)
+            if on_frame:
+                on_frame(idx, frame, tracks)
+            stats.written += 1
+    except Exception as e:
+        errors.append(e)  # re-raised by run_video; stop halts the reader and the producer
+        stop.set()
+    finally:
+        if writer is not None:
+            writer.release()
+
+
+def _put(out_q, item, errors):
+    """Queue item for the writer; False once the writer has died, instead of blocking forever."""
+    while not errors:
+        try:
+            out_q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def run_video(source, model, out_path=None, stride=2, batch=4, conf=0.25, iou=0.5, imgsz=640,
+              labels=VEHICLE_LABELS, device=None, track=True, queue_size=64, drop=None,
+              on_frame=None, max_frames=None, plates=None, index=None, model_name=None):
+    """Run the reader → batched inference → writer pipeline; returns a stats dict.
+
+    on_frame(idx, annotated_bgr, boxes) is called from the writer thread for every output frame.
+    plates (a PlateReader) adds plate reads; with tracking each vehicle is OCR'd only a few times.
+    index (a DetectionIndex) records each detected frame under the key "<source>#<frame>".
+    """
+    cap = open_source(source)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    device = default_device() if device is None else device
+    drop = is_live(source) if drop is None else drop
+    class_ids = vehicle_class_ids(model.names, labels)
+    tracker = IoUTracker() if track else None
+    track_plates = TrackPlates(plates) if plates is not None and tracker else None
+    stats = VideoStats()
+    frames_q = queue.Queue(maxsize=queue_size)
+    out_q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []  # exception that killed the writer thread
+
+    def make_writer(frame):
+        h, w = frame.shape[:2]
+        out = cv2.VideoWriter(out_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (w, h))
+        if not out.isOpened():
+            raise IOError(f"cannot open video output: {out_path}")
+        return out
+
+    reader = threading.Thread(target=_reader, args=(cap, frames_q, stats, drop, stop), daemon=True)
+    writer = threading.Thread(target=_writer, args=(out_q, make_writer if out_path else None, stats, on_frame,
+                                                    stop, errors), daemon=True)
+    reader.start()
+    writer.start()
+
+    pending = []  # (idx, frame, run_detector) waiting for the next batch, in order
+    last_boxes = []
+
+    def flush():
+        nonlocal last_boxes
+        detect = [(i, f) for i, f, run in pending if run]
+        results = {}
+        if detect:
+            preds = model.predict([f for _, f in detect], conf=conf, iou=iou, imgsz=imgsz,
+                                  classes=class_ids, device=device, verbose=False)
+            record_yolo_speed(preds)
+            results = {i: vehicle_boxes(r, labels) for (i, _), r in zip(detect, preds)}
+            stats.detected += len(detect)
+        out = []
+        for i, frame, _ in pending:
+            if i in results:
+                with timed("track"):
+                    boxes = tracker.update(results[i], i) if tracker else results[i]
+                last_boxes = boxes
+            else:
+                boxes = tracker.predict(i) if tracker else last_boxes
+            out.append((i, frame, boxes, tracker.unique_count if tracker else None))
+        if plates is not None:
+            # Plates are read on detected frames only, all crops of this batch in one OCR pass
+            detected = [(frame, boxes) for i, frame, boxes, _ in out if i in results]
+            if track_plates:
+                track_plates.update(detected)
+                for _, _, boxes, _ in out:
+                    track_plates.annotate(boxes)
+            elif detected:
+                plates.read_many(detected)
+        if index is not None and results:
+            with timed("index"):
+                index.add_many([{"key": f"{source}#{i}", "path": str(source), "boxes": boxes, "source": "video",
+                                 "model": model_name, "width": frame.shape[1], "height": frame.shape[0]}
+                                for i, frame, boxes, _ in out if i in results])
+        pending.clear()
+        for item in out:
+            if not _put(out_q, item, errors):
+                raise errors[0]
+
+    received = 0
+    try:
+        while True:
+            item = frames_q.get()
+            if item is _EOS:
+                break
+            # Stride counts frames that arrived, so dropped frames don't skew the sampling
+            pending.append((*item, received % stride == 0))
+            received += 1
+            if max_frames and item[0] + 1 >= max_frames:
+                break  # frames the reader already queued past the limit are discarded below
+            if sum(1 for *_, run in pending if run) >= batch:
+                flush()
+        flush()
+    finally:
+        stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while reader.is_alive():
+            try:
+                frames_q.get_nowait()
+            except queue.Empty:
+                reader.join(0.05)
+        _put(out_q, _EOS, errors)
+        writer.join()
+        stats.finished = time.perf_counter()
+    if errors:
+        raise errors[0]
+    summary = stats.as_dict(tracker)
+    if track_plates:
+        summary["plates"] = track_plates.plates()
+    if plates is not None:
+        summary["plate_ocr"] = plates.stats()
+    return summary
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(description="Vehicle detection on video / camera streams")
+    ap.add_argument("source", help="video file, rtsp:// URL or camera index")
+    ap.add_argument("--out", help="annotated output video (.mp4)")
+    ap.add_argument("--weights", default="n", help=f"model size ({'/'.join(MODEL_SIZES)}) or weights path")
+    ap.add_argument("--stride", type=int, default=2, help="run the detector on every Nth frame")
+    ap.add_argument("--batch", type=int, default=4, help="detected frames per model call")
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--iou", type=float, default=0.5)
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--device", default=None)
+    ap.add_argument("--backend", choices=("auto",) + backends.BACKENDS, default="auto")
+    ap.add_argument("--int8", action="store_true", help="INT8-quantized ONNX/OpenVINO export")
+    ap.add_argument("--calib", help="folder of images for INT8 calibration")
+    ap.add_argument("--no-track", action="store_true", help="disable tracking / unique counting")
+    ap.add_argument("--plates", action="store_true", help="read license plates (easyocr), a few reads per track")
+    ap.add_argument("--index", nargs="?", const=INDEX_DB, default=None, metavar="DB",
+                    help="record detected frames in the SQLite detection index")
+    ap.add_argument("--queue", type=int, default=64, help="frames buffered between stages")
+    ap.add_argument("--max-frames", type=int, default=None)
+    ap.add_argument("--drop", choices=["auto", "yes", "no"], default="auto",
+                    help="drop frames when inference falls behind (auto = only for live sources)")
+    return ap
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    model, device, backend = backends.load(args.weights, args.backend, args.int8, args.calib,
+                                           imgsz=args.imgsz, device=args.device)
+    drop = None if args.drop == "auto" else args.drop == "yes"
+    stats = run_video(args.source, model, out_path=args.out, stride=max(1, args.stride),
+                      batch=max(1, args.batch), conf=args.conf, iou=args.iou, imgsz=args.imgsz,
+                      device=device, track=not args.no_track, queue_size=args.queue, drop=drop,
+                      max_frames=args.max_frames, plates=PlateReader() if args.plates else None,
+                      index=DetectionIndex(args.index) if args.index else None, model_name=args.weights)
+    print(json.dumps({**stats, "backend": backend}))
+
+
+if __name__ == "__main__":
+    main()